@@ -0,0 +1,70 @@
+'''Author: Andrew Martin
+Creation Date: 18/10/26
+
+Benchmark for the per-update cost of the DataLoader as its loaded history grows.
+
+A directory of synthetic daily files (1 minute resolution, ASFS-like) is written to a temporary directory, and a DataLoader is asked for one new day at a time, as if a user were stepping the datetime picker through a season. Each update loads one file and serves one day, so its cost should stay flat from 1 to 200 loaded days rather than growing with the loaded history.
+
+Run with:
+    python benchmarks/bench_dataloader_update.py [--days 200]
+'''
+
+import argparse
+import datetime as dt
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from sleigh_dashboard import DataLoader
+
+
+def write_daily_files(dir: str, start: dt.date, ndays: int, nvars: int = 10) -> None:
+    rng = np.random.default_rng(0)
+    for i in range(ndays):
+        day = start + dt.timedelta(days=i)
+        time_ = pd.date_range(day, periods=1440, freq='1min')
+        ds = xr.Dataset(
+            {f'var{j}_mean': ('time', rng.standard_normal(time_.size)) for j in range(nvars)},
+            coords={'time': time_}
+        )
+        ds.to_netcdf(os.path.join(dir, day.strftime('summary_bench_%Y%m%d.nc')))
+
+
+def run(ndays: int = 200, report: tuple[int] = (1, 10, 25, 50, 100, 150, 200)) -> dict[int: float]:
+    '''Returns the mean time (in seconds) of the updates around each number of loaded days in report.'''
+    start = dt.date(2024, 5, 15)
+    with tempfile.TemporaryDirectory() as dir:
+        write_daily_files(dir, start, ndays + 1)
+        DataLoader.set_memory_budget(2**40)
+        dl = DataLoader.DataLoader('bench', dir, 'summary_bench_%Y%m%d.nc')
+
+        timings = []
+        for i in range(ndays):
+            dtr = (start + dt.timedelta(days=i), start + dt.timedelta(days=i+1))
+            t0 = time.perf_counter()
+            ds = dl(dtr)
+            ds['var0_mean'].values
+            timings.append(time.perf_counter() - t0)
+
+    # average over a small window of updates to smooth out noise
+    return {
+        n: float(np.mean(timings[max(0, n-5):n]))
+        for n in report if n <= ndays
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time DataLoader updates as the loaded history grows.')
+    parser.add_argument('--days', type=int, default=200, help='number of days to load one at a time.')
+    args = parser.parse_args()
+
+    results = run(args.days)
+    print(f'{"loaded days":>12} | {"update time (ms)":>16}')
+    for n, t in results.items():
+        print(f'{n:>12} | {1e3*t:>16.2f}')
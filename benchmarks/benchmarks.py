@@ -0,0 +1,216 @@
+'''Author: Andrew Martin
+Creation Date: 18/10/26
+
+asv benchmark suite for the hot paths of the dashboard, run against synthetic data (see synthetic.py) for each instrument over datetime ranges of several lengths:
+    loading the data of a range into a new DataLoader (DataLoader.update_data),
+    serving a range that is already loaded (DataLoader.__call__),
+    loading a range in a process pool through the chunk store, before and after the store holds it (ChunkStore),
+    fetching the data bundle of a Tab (Tab._bind_data),
+    plotting every plottable of a Tab (Plottable.plot),
+    constructing a Tab (get_*_tab),
+    importing the package in a fresh interpreter (see import_time.py for the import-time budget).
+
+Run with (from the repository root):
+    asv run            # benchmark the current commit
+    asv continuous main HEAD    # compare two commits, failing on regressions
+'''
+
+import asyncio
+import datetime as dt
+import os
+import shutil
+import tempfile
+
+from sleigh_dashboard import ChunkStore, DataLoader, RenderCache
+from tabs.instrument import tab_asfs, tab_cl61, tab_gfs, tab_gpr, tab_mrr, tab_mvp, tab_mwr, tab_simba, tab_turb
+
+from . import synthetic
+
+START = dt.date(2024, 5, 15)
+# lengths (in days) of the benchmarked datetime ranges
+RANGE_DAYS = [1, 7, 28]
+
+# DataLoader name: function returning a new DataLoader
+LOADERS = {
+    'asfs': tab_asfs.DL_asfs_slow,
+    'turb': tab_turb.DL_asfs_turb,
+    'cl61': tab_cl61.DL_cl61,
+    'mrr': tab_mrr.DL_mrr,
+    'mwr': tab_mwr.DL_mwr,
+    'gpr5': tab_gpr.DL_gpr5,
+    'gpr7': tab_gpr.DL_gpr7,
+    'simba': tab_simba.DL_simba,
+    'mvp': tab_mvp.DL_mvp,
+    'gfs': tab_gfs.DL_gfs,
+}
+
+# tab name: function returning a new Tab
+TABS = {
+    'asfs': tab_asfs.get_asfs_tab,
+    'turb': tab_turb.get_turb_tab,
+    'cl61': tab_cl61.get_lidar_tab,
+    'mrr': tab_mrr.get_radar_tab,
+    'mwr': tab_mwr.get_mwr_tab,
+    'gpr': tab_gpr.get_gpr_tab,
+    'simba': tab_simba.get_simba_tab,
+    'mvp': tab_mvp.get_mvp_tab,
+    'gfs': tab_gfs.get_gfs_tab,
+}
+
+
+def _dtr(ndays: int) -> tuple[dt.date, dt.date]:
+    return (START, START + dt.timedelta(days=ndays))
+
+
+def _write_data() -> str:
+    '''Writes the synthetic data into asv's cache directory (the working directory of setup_cache), returning its path.'''
+    root = os.path.abspath('synthetic-data')
+    synthetic.generate(root, START, max(RANGE_DAYS))
+    return root
+
+
+def _use_data(root: str) -> None:
+    '''Points the DataLoaders at the synthetic data, without a memory limit, chunk store or render cache, so every benchmark measures the work itself.'''
+    os.environ[DataLoader.DATA_ROOT_ENV] = root
+    DataLoader.set_memory_budget(2**40)
+    DataLoader.set_chunk_store(None)
+    RenderCache.set_render_cache_size(0)
+
+
+def _new_tab(name: str, augment: bool = False):
+    '''Returns a new Tab, with new DataLoaders for the data it requires.'''
+    tab = TABS[name](augment)
+    tab.dld = {dl: LOADERS[dl]() for dl in tab.required_DL}
+    return tab
+
+
+class DataLoaderSuite:
+    '''Loading (cold) and serving (warm) a datetime range from each DataLoader.'''
+    params = (list(LOADERS), RANGE_DAYS)
+    param_names = ['loader', 'days']
+    timeout = 600
+    # each sample needs a new DataLoader, so the load is never served from memory
+    number = 1
+    repeat = 5
+
+    def setup_cache(self):
+        return _write_data()
+
+    def setup(self, root, loader, days):
+        _use_data(root)
+        self.dtr = _dtr(days)
+        self.cold = LOADERS[loader]()
+        self.warm = LOADERS[loader]()
+        self.warm.update_data(self.dtr)
+
+    def time_update_data(self, root, loader, days):
+        self.cold.update_data(self.dtr)
+
+    def time_call(self, root, loader, days):
+        self.warm(self.dtr)
+
+    def time_call_augmented(self, root, loader, days):
+        self.warm(self.dtr, augment=True)
+
+    def peakmem_update_data(self, root, loader, days):
+        self.cold.update_data(self.dtr)
+
+
+class ChunkStoreSuite:
+    '''Loading a datetime range in a process pool with a chunk store, which must send the store (and file_preproc) to the workers. The cold load preprocesses each file and writes it to an empty store, the warm load reads the stored arrays instead.'''
+    params = RANGE_DAYS
+    param_names = ['days']
+    timeout = 600
+    number = 1
+    repeat = 5
+
+    def setup_cache(self):
+        return _write_data()
+
+    def setup(self, root, days):
+        _use_data(root)
+        self.dtr = _dtr(days)
+        self.store_dir = tempfile.mkdtemp()
+        self.warm_dir = tempfile.mkdtemp()
+        # the synthetic files were written recently, so are stored without waiting for them to settle
+        self.warm_store = ChunkStore.ChunkStore(self.warm_dir, min_age=0)
+        DataLoader.chunk_store = self.warm_store
+        self._check(self._new_loader())
+        DataLoader.chunk_store = ChunkStore.ChunkStore(self.store_dir, min_age=0)
+        self.cold = self._new_loader()
+        self.warm = self._new_loader()
+
+    def teardown(self, root, days):
+        DataLoader.set_chunk_store(None)
+        shutil.rmtree(self.store_dir, ignore_errors=True)
+        shutil.rmtree(self.warm_dir, ignore_errors=True)
+
+    def _new_loader(self) -> DataLoader.DataLoader:
+        return DataLoader.DataLoader('mvp', DataLoader.data_path('power', 'level2'), 'power.mvp.level2.1min.%Y%m%d.000000.nc', file_preproc=tab_mvp.mvp_load_preproc, max_workers=4, executor='process')
+
+    def _check(self, loader: DataLoader.DataLoader) -> None:
+        '''Loads the range with loader, raising if any file failed to load or wasn't stored.'''
+        loader.update_data(self.dtr)
+        if len(loader.chunks) < (self.dtr[1] - self.dtr[0]).days:
+            raise RuntimeError(f'only {len(loader.chunks)} files were loaded in the process pool')
+        stored = os.listdir(os.path.join(DataLoader.chunk_store.root, loader.name))
+        if len([d for d in stored if not d.startswith('.')]) < len(loader.chunks):
+            raise RuntimeError(f'only {len(stored)} of {len(loader.chunks)} files were written to the chunk store')
+
+    def time_update_data_cold(self, root, days):
+        self.cold.update_data(self.dtr)
+
+    def time_update_data_warm(self, root, days):
+        DataLoader.chunk_store = self.warm_store
+        self.warm.update_data(self.dtr)
+
+
+class TabSuite:
+    '''Fetching the data of each Tab, and plotting it.'''
+    params = (list(TABS), RANGE_DAYS)
+    param_names = ['tab', 'days']
+    timeout = 600
+    number = 1
+    repeat = 5
+
+    def setup_cache(self):
+        return _write_data()
+
+    def setup(self, root, tab, days):
+        _use_data(root)
+        self.dtr = _dtr(days)
+        self.cold = _new_tab(tab)
+        self.warm = _new_tab(tab)
+        self.dd = asyncio.run(self.warm._bind_data(self.dtr))
+
+    def time_bind_data(self, root, tab, days):
+        asyncio.run(self.cold._bind_data(self.dtr))
+
+    def time_bind_data_warm(self, root, tab, days):
+        asyncio.run(self.warm._bind_data(self.dtr))
+
+    def time_plot(self, root, tab, days):
+        # a new bundle (and DerivedCache) each time, so that derived variables are calculated as they would be for a new range
+        dd = type(self.dd)(dict(self.dd), self.dd.dtr, self.dd.augment, self.dd.versions, self.warm.derived)
+        for p in self.warm.plottables:
+            for f, owner in zip(p.plotfuncs, p._plotfunc_owners()):
+                f(dd.select(owner._variables()))
+
+
+class TabConstructionSuite:
+    '''Constructing each Tab, which happens for every tab of every new session.'''
+    params = (list(TABS), [False, True])
+    param_names = ['tab', 'augment']
+
+    def time_construct(self, tab, augment):
+        TABS[tab](augment)
+
+
+class ImportSuite:
+    '''Importing the data layer, and the whole package, in a fresh interpreter, which happens on every restart.'''
+
+    def timeraw_import_dataloader(self):
+        return 'import sleigh_dashboard.DataLoader'
+
+    def timeraw_import_dashboard(self):
+        return 'import sleigh_dashboard.Dashboard'
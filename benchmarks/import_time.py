@@ -0,0 +1,68 @@
+'''Author: Andrew Martin
+Creation Date: 18/10/26
+
+Script checking the import-time budget of the dashboard, which bounds how long a restart takes before the server can open its port. Each module in BUDGETS is imported in a fresh interpreter with python -X importtime (from the repository root, so that dashboard.py is imported as it is when run, without serving), and the import fails its budget if it takes longer than the budget or imports any of the modules it should leave to first use.
+
+    python benchmarks/import_time.py            # check every budget, exiting with 1 if one is exceeded
+    python benchmarks/import_time.py --top 20   # also list the slowest imports of each module
+'''
+
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# module: (budget in seconds, modules it must not import)
+BUDGETS = {
+    # the data layer, without the plotting stack
+    'sleigh_dashboard.DataLoader': (1.5, ['holoviews', 'hvplot', 'panel', 'bokeh', 'datashader']),
+    # the server script (up to opening the port), which imports panel but leaves the tabs and plotting libraries to the first session
+    'dashboard': (3.0, ['holoviews', 'hvplot', 'datashader', 'sleigh_dashboard.Plottables', 'tabs.instrument.tab_asfs', 'tabs.science.tab_met']),
+}
+
+
+def import_times(module: str, repeat: int = 3) -> tuple[float, list[tuple[float, float, str]]]:
+    '''Imports module in a fresh interpreter repeat times, returning the fastest total import time (in seconds), and the (self, cumulative, name) times of every module imported in that run, slowest cumulative first.'''
+    best = None
+    for _ in range(repeat):
+        env = {**os.environ, 'PYTHONPATH': os.pathsep.join(filter(None, [ROOT, os.environ.get('PYTHONPATH')]))}
+        proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'], cwd=ROOT, env=env, capture_output=True, text=True)
+        if proc.returncode != 0:
+            raise RuntimeError(f'importing {module} failed:\n{proc.stderr[-2000:]}')
+        rows = []
+        for line in proc.stderr.splitlines():
+            if not line.startswith('import time:') or 'self [us]' in line: continue
+            self_us, cumulative_us, name = line[len('import time:'):].split('|')
+            # the nesting of an import is given by the indentation of its name
+            rows.append((int(self_us)/1e6, int(cumulative_us)/1e6, name.rstrip()))
+        # top-level imports aren't indented (beyond the separator's space)
+        total = sum(cumulative for _, cumulative, name in rows if not name[1:].startswith(' '))
+        if best is None or total < best[0]:
+            best = (total, sorted(rows, key=lambda r: -r[1]))
+    return best
+
+
+def check(module: str, budget: float, forbidden: list[str], top: int = 0) -> bool:
+    '''Prints the import time of module against its budget (and its top slowest imports), returning whether it is within budget.'''
+    total, rows = import_times(module)
+    imported = {name.strip() for _, _, name in rows}
+    leaked = [m for m in forbidden if m in imported]
+    ok = total <= budget and not leaked
+    print(f'{"ok  " if ok else "FAIL"} {module}: {total:.2f}s (budget {budget:.2f}s)')
+    if leaked:
+        print(f'     imports {", ".join(leaked)}, which should be imported on first use')
+    for self_s, cumulative, name in rows[:top]:
+        print(f'     {cumulative:7.3f}s {self_s:7.3f}s {name}')
+    return ok
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Check the import-time budget of the dashboard.')
+    parser.add_argument('modules', nargs='*', default=list(BUDGETS), help='Modules to check (default all of BUDGETS).')
+    parser.add_argument('--top', type=int, default=0, help='Number of the slowest imports (by cumulative time) to list for each module.')
+    args = parser.parse_args()
+
+    results = [check(m, *BUDGETS.get(m, (float('inf'), [])), top=args.top) for m in args.modules]
+    sys.exit(0 if all(results) else 1)
@@ -0,0 +1,456 @@
+'''Author: Andrew Martin
+Creation Date: 18/10/26
+
+Load test of the dashboard server with many simultaneous sessions, as happens during melt events.
+
+The real server (dashboard.py) is started on a local port, serving synthetic data (see synthetic.py) that ends today, so the default datetime range has data. N headless Bokeh client sessions then connect, each from its own thread, and behave like a visitor: they change the global datetime range picker, switch tabs, and turn the Compare switch on and off. Every action is timed from the moment it is sent until the server has stopped sending updates to the session's document.
+
+Reported are the session creation latency, the percentiles of the update latency for each kind of action, the actions that failed (the connection was closed, or the server sent no update within --timeout seconds), and the peak RSS and CPU time of the server (all of its processes), in total and per session. RSS and CPU are read from /proc, so the load test runs on Linux only, and needs no network access.
+
+The update latency is measured to within the polling interval (--poll), and includes the time the client threads take to apply the updates, which grows with the number of sessions run from a single client process.
+
+Run with:
+    python benchmarks/loadtest.py --sessions 20 [--actions 10] [--num-procs 1] [--data /tmp/sleigh-data]
+'''
+
+import argparse
+import concurrent.futures
+import datetime as dt
+import json
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+# the client needs panel's bokeh models to read the documents served by the dashboard
+import panel.models
+from bokeh.client import pull_session
+from bokeh.core.serialization import UnknownReferenceError
+from bokeh.document import Document
+from bokeh.events import DocumentReady
+from bokeh.models import DateRangePicker, Switch, Tabs
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import synthetic
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CLK_TCK = os.sysconf('SC_CLK_TCK')
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+
+
+def _process_tree(pid: int) -> list[int]:
+    '''Returns pid and the pids of all of its descendants (the forked server processes).'''
+    children = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit(): continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    pids, stack = [], [pid]
+    while stack:
+        p = stack.pop()
+        pids.append(p)
+        stack.extend(children.get(p, []))
+    return pids
+
+
+def _usage(pids: list[int]) -> tuple[int, float]:
+    '''Returns the total (RSS in bytes, CPU time in seconds) of the processes in pids.'''
+    rss, cpu = 0, 0.
+    for pid in pids:
+        try:
+            with open(f'/proc/{pid}/stat') as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+            with open(f'/proc/{pid}/statm') as f:
+                rss += int(f.read().split()[1]) * PAGE_SIZE
+        except (OSError, IndexError, ValueError):
+            # the process has exited
+            continue
+        # utime and stime, fields 14 and 15 of /proc/<pid>/stat
+        cpu += (int(fields[11]) + int(fields[12])) / CLK_TCK
+    return rss, cpu
+
+
+class ResourceMonitor(threading.Thread):
+    '''Thread that samples the RSS and CPU time of the server processes every interval seconds, recording the peak RSS.'''
+
+    def __init__(self, pid: int, interval: float = 0.25):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.peak_rss = 0
+        self._finished = threading.Event()
+
+    def sample(self) -> tuple[int, float]:
+        rss, cpu = _usage(_process_tree(self.pid))
+        self.peak_rss = max(self.peak_rss, rss)
+        return rss, cpu
+
+    def run(self):
+        while not self._finished.wait(self.interval):
+            self.sample()
+
+    def stop(self):
+        self._finished.set()
+        self.join()
+
+
+def start_server(port: int, data_root: str, num_procs: int, cache_dir: str, log_path: str, timeout: float = 300) -> tuple[subprocess.Popen, float]:
+    '''Starts dashboard.py on port, returning the process and the time taken for the port to open.'''
+    env = dict(os.environ, SLEIGH_DASHBOARD_DATA_ROOT=data_root)
+    cmd = [sys.executable, 'dashboard.py', '--port', str(port), '--num-procs', str(num_procs), '--cache-dir', cache_dir]
+    t0 = time.perf_counter()
+    with open(log_path, 'w') as log:
+        proc = subprocess.Popen(cmd, cwd=REPO_ROOT, env=env, stdout=log, stderr=subprocess.STDOUT, start_new_session=True)
+    while time.perf_counter() - t0 < timeout:
+        if proc.poll() is not None:
+            raise RuntimeError(f'loadtest.py: the server exited with code {proc.returncode}, see {log_path}')
+        try:
+            socket.create_connection(('localhost', port), timeout=1).close()
+            return proc, time.perf_counter() - t0
+        except OSError:
+            time.sleep(0.1)
+    stop_server(proc)
+    raise TimeoutError(f'loadtest.py: the server did not open port {port} within {timeout} s, see {log_path}')
+
+
+def stop_server(proc: subprocess.Popen) -> None:
+    '''Stops the server and any processes it forked.'''
+    try:
+        os.killpg(proc.pid, signal.SIGTERM)
+        proc.wait(timeout=10)
+    except ProcessLookupError:
+        pass
+    except subprocess.TimeoutExpired:
+        os.killpg(proc.pid, signal.SIGKILL)
+
+
+class VisitorSession:
+    '''A headless client session of the dashboard, with the widgets a visitor uses.
+
+    The session is pulled by a background thread, which then runs the event loop of its connection: applying the updates sent by the server as they arrive, and recording the time of the latest one. Everything that reads or changes the document runs on that thread (see _call), so the document is only used by one thread.
+
+    Whenever the Bokeh server applies a patch from a client, it counts every model of the session's document as sent to the client, including models created since its last update to the client, which it then never sends. An update referring to one of those can't be applied, so the session pulls the whole document again (counted in resyncs), rather than stopping or falling behind the server.
+
+    ATTRIBUTES:
+        session: bokeh.client.ClientSession
+        gdtp: bokeh.models.DateRangePicker
+            the global datetime range picker (the one that isn't inside the tabs)
+        tabs: bokeh.models.Tabs
+        compare: bokeh.models.Switch
+        latencies: dict[str: list[float]]
+            update latencies (in seconds) of each kind of action
+        errors: list[str]
+            actions that failed, because the connection was closed or the server sent no update within timeout seconds
+        resyncs: int
+            number of times the document was pulled again
+    '''
+
+    def __init__(self, url: str, quiet: float, poll: float, timeout: float):
+        self.quiet = quiet
+        self.poll = poll
+        self.timeout = timeout
+        self.latencies = {}
+        self.errors = []
+        self.resyncs = 0
+        self._last_update = None
+        self._resyncing = False
+        self._closing = False
+        self._closed = threading.Event()
+        self._ready = threading.Event()
+        self._error = None
+
+        t0 = time.perf_counter()
+        self._thread = threading.Thread(target=self._run_connection, args=(url,), daemon=True)
+        self._thread.start()
+        if not self._ready.wait(self.timeout):
+            raise TimeoutError(f'VisitorSession: the document was not pulled within {self.timeout} s')
+        if self._error is not None:
+            raise self._error
+        self.latencies['create'] = [time.perf_counter() - t0]
+
+        # panel holds back the session's updates until the browser reports that the page has loaded. Any plots that weren't ready when the document was pulled are sent after that
+        t0 = time.perf_counter()
+        self._call(lambda: self.session.document.callbacks.send_event(DocumentReady()))
+        # a session whose plots were all sent with the document has no updates, and is counted as 'first_render (no update)'
+        self._record('first_render', t0, timeout=self.quiet, required=False)
+
+    def _run_connection(self, url: str) -> None:
+        '''Pulls the session, then runs its connection's event loop until the connection is closed, pulling the document again whenever an update can't be applied.'''
+        try:
+            self.session = pull_session(url=url)
+            self._connection = self.session._connection
+            self.session._handle_patch = self._handle_patch
+            self.session.document.on_change(self._on_change)
+            self._find_widgets()
+        except Exception as e:
+            self._error = e
+            self._closed.set()
+            self._ready.set()
+            return
+        self._ready.set()
+
+        while True:
+            self._connection.loop_until_closed()
+            if not self._resyncing: break
+            try:
+                # into a new document, as ClientSession.pull would send the models it adds to the current one back to the server
+                doc = Document()
+                self._connection.pull_doc(doc)
+                self.session._attach_document(doc)
+                doc.on_change(self._on_change)
+                self._find_widgets()
+            except Exception as e:
+                print(f'VisitorSession._run_connection: failed to pull the document again: {type(e).__name__}: {e}')
+                break
+            self._last_update = time.perf_counter()
+            self._resyncing = False
+        self._closed.set()
+
+    def _handle_patch(self, message) -> None:
+        # replaces ClientSession._handle_patch, called on the connection's event loop for each update from the server
+        try:
+            message.apply_to_document(self.session.document, self.session)
+        except UnknownReferenceError:
+            # stop the loop after this message (see ClientConnection._next), so that _run_connection can pull the document. Updates sent before the document are dropped, as they are already part of it
+            self.resyncs += 1
+            self._resyncing = True
+            self._connection._until_predicate = lambda: True
+
+    def _find_widgets(self) -> None:
+        doc = self.session.document
+        self.tabs = next(m for m in doc.models if isinstance(m, Tabs))
+        self.compare = next(m for m in doc.models if isinstance(m, Switch))
+        in_tabs = {m.id for m in self.tabs.references()}
+        self.gdtp = next(m for m in doc.models if isinstance(m, DateRangePicker) and m.id not in in_tabs)
+
+    def _call(self, func: callable, *args):
+        '''Runs func(*args) on the connection's event loop, once the document isn't being pulled again, returning its result.'''
+        future = concurrent.futures.Future()
+        loop = self._connection._loop
+
+        def run():
+            if self._resyncing:
+                loop.call_later(self.poll, run)
+                return
+            try:
+                future.set_result(func(*args))
+            except Exception as e:
+                future.set_exception(e)
+
+        loop.add_callback(run)
+        return future.result(timeout=self.timeout)
+
+    def _on_change(self, event) -> None:
+        # only changes sent by the server, not those made by this client
+        if getattr(event, 'setter', None) is self.session:
+            self._last_update = time.perf_counter()
+
+    def _wait_for_updates(self, t0: float, timeout: float | None = None) -> float | None:
+        '''Waits until no updates have arrived from the server for quiet seconds. Returns the time from t0 to the last update, or None if there weren't any within timeout seconds (default self.timeout). Raises ConnectionError if the connection is closed first.'''
+        if timeout is None: timeout = self.timeout
+        while True:
+            time.sleep(self.poll)
+            now = time.perf_counter()
+            last = self._last_update if self._last_update is not None and self._last_update >= t0 else None
+            if self._closed.is_set():
+                raise ConnectionError(f'connection closed ({self._connection.error_code}: {self._connection.error_detail or "no detail"})')
+            if last is not None and now - last >= self.quiet and not self._resyncing: return last - t0
+            if last is None and now - t0 >= timeout: return None
+
+    def _record(self, action: str, t0: float, timeout: float | None = None, required: bool = True) -> None:
+        '''Records the update latency of action, sent at t0. An action that required an update but had none is recorded as an error, otherwise as '<action> (no update)'.'''
+        try:
+            latency = self._wait_for_updates(t0, timeout)
+        except ConnectionError as e:
+            self.errors.append(f'{action}: {e}')
+            raise
+        if latency is not None:
+            self.latencies.setdefault(action, []).append(latency)
+        elif required:
+            self.errors.append(f'{action}: no update within {self.timeout:g} s')
+        else:
+            self.latencies.setdefault(f'{action} (no update)', []).append(np.nan)
+
+    def _change(self, action: str, widget: str, attr: str, value) -> None:
+        t0 = time.perf_counter()
+        # the widget is looked up on the loop, as pulling the document again replaces it
+        self._call(lambda: setattr(getattr(self, widget), attr, value))
+        self._record(action, t0)
+
+    def get(self, widget: str, attr: str):
+        '''Returns the value of attr of the widget with attribute name widget (e.g. 'gdtp').'''
+        return self._call(lambda: getattr(getattr(self, widget), attr))
+
+    def set_dtr(self, start: dt.date, end: dt.date) -> None:
+        self._change('dtr', 'gdtp', 'value', (start.isoformat(), end.isoformat()))
+
+    def set_tab(self, index: int) -> None:
+        self._change('tab', 'tabs', 'active', index)
+
+    def set_compare(self, on: bool) -> None:
+        self._change('compare_on' if on else 'compare_off', 'compare', 'active', on)
+
+    def close(self) -> None:
+        if not self._closed.is_set():
+            self._connection._loop.add_callback(self.session.close)
+        self._thread.join(timeout=10)
+
+
+def visit(url: str, args: argparse.Namespace, days: list[dt.date], seed: int, results: list, errors: list) -> None:
+    '''Runs the actions of a single visitor, appending its latencies, errors and resyncs to results.'''
+    rng = random.Random(seed)
+    v = None
+    try:
+        v = VisitorSession(url, args.quiet, args.poll, args.timeout)
+        ntabs = len(v.get('tabs', 'tabs'))
+        for i in range(args.actions):
+            action = ('dtr', 'tab', 'dtr', 'tab', 'compare')[i % 5]
+            if action == 'dtr':
+                # a range different to the current one, which would send no update
+                current = tuple(v.get('gdtp', 'value'))
+                while True:
+                    start = rng.choice(days[:-1])
+                    end = rng.choice([d for d in days if d > start])
+                    if (start.isoformat(), end.isoformat()) != current: break
+                v.set_dtr(start, end)
+            elif action == 'tab':
+                active = v.get('tabs', 'active')
+                v.set_tab(rng.choice([t for t in range(ntabs) if t != active]))
+            elif args.compare:
+                v.set_compare(True)
+                v.set_compare(False)
+        completed = True
+    except Exception as e:
+        errors.append(f'{type(e).__name__}: {e}')
+        completed = False
+    if v is not None:
+        results.append({'latencies': v.latencies, 'errors': v.errors, 'resyncs': v.resyncs, 'completed': completed})
+        v.close()
+
+
+def _percentiles(values: list[float]) -> dict[str: float]:
+    values = np.asarray(values, dtype=float)
+    if np.isnan(values).all():
+        return {'n': values.size}
+    return {
+        'n': values.size,
+        'p50': float(np.nanpercentile(values, 50)),
+        'p90': float(np.nanpercentile(values, 90)),
+        'p99': float(np.nanpercentile(values, 99)),
+        'max': float(np.nanmax(values)),
+    }
+
+
+def run(args: argparse.Namespace) -> dict:
+    '''Runs the load test described by args, returning its report.'''
+    tmp = tempfile.mkdtemp(prefix='sleigh-loadtest-')
+    today = dt.date.today()
+    days = [today - dt.timedelta(days=i) for i in range(args.days - 1, -1, -1)]
+    data_root = args.data
+    if data_root is None:
+        data_root = os.path.join(tmp, 'data')
+        print(f'loadtest.py: writing {args.days} days of synthetic data to {data_root}')
+        synthetic.generate(data_root, days[0], args.days)
+    cache_dir = os.path.join(tmp, 'cache') if args.num_procs > 1 else ''
+
+    log_path = os.path.join(tmp, 'server.log')
+    proc, startup = start_server(args.port, data_root, args.num_procs, cache_dir, log_path)
+    print(f'loadtest.py: server listening on port {args.port} after {startup:.1f} s, log in {log_path}')
+    monitor = ResourceMonitor(proc.pid)
+    try:
+        rss0, cpu0 = monitor.sample()
+        monitor.start()
+        url = f'http://localhost:{args.port}/{args.app}'
+        results, errors, threads = [], [], []
+        t0 = time.perf_counter()
+        for i in range(args.sessions):
+            t = threading.Thread(target=visit, args=(url, args, days, args.seed + i, results, errors), daemon=True)
+            t.start()
+            threads.append(t)
+            time.sleep(args.ramp / max(args.sessions, 1))
+        for t in threads:
+            t.join()
+        wall = time.perf_counter() - t0
+        rss1, cpu1 = monitor.sample()
+        monitor.stop()
+    finally:
+        stop_server(proc)
+
+    latencies, action_errors = {}, {}
+    for r in results:
+        for action, values in r['latencies'].items():
+            latencies.setdefault(action, []).extend(values)
+        for e in r['errors']:
+            action_errors[e] = action_errors.get(e, 0) + 1
+    nsessions = max(len(results), 1)
+    return {
+        'sessions': args.sessions,
+        'completed_sessions': sum(r['completed'] for r in results),
+        'errors': errors,
+        'action_errors': dict(sorted(action_errors.items())),
+        'resyncs': sum(r['resyncs'] for r in results),
+        'num_procs': args.num_procs,
+        'startup_s': startup,
+        'wall_s': wall,
+        'latency_s': {action: _percentiles(values) for action, values in sorted(latencies.items())},
+        'rss_start_MB': rss0 / 1024**2,
+        'rss_peak_MB': monitor.peak_rss / 1024**2,
+        'rss_end_MB': rss1 / 1024**2,
+        'rss_peak_per_session_MB': (monitor.peak_rss - rss0) / 1024**2 / nsessions,
+        'cpu_s': cpu1 - cpu0,
+        'cpu_per_session_s': (cpu1 - cpu0) / nsessions,
+    }
+
+
+def print_report(report: dict) -> None:
+    print(f'\n{report["completed_sessions"]}/{report["sessions"]} sessions completed in {report["wall_s"]:.1f} s ({report["num_procs"]} server processes, started in {report["startup_s"]:.1f} s)')
+    for e in report['errors']:
+        print(f'    session error: {e}')
+    for e, n in report['action_errors'].items():
+        print(f'    action error: {e} ({n} times)')
+    if report['resyncs']:
+        print(f'    the documents of the sessions were pulled again {report["resyncs"]} times, after updates that could not be applied')
+    print(f'\n{"action":>24} | {"n":>5} | {"p50 (s)":>8} | {"p90 (s)":>8} | {"p99 (s)":>8} | {"max (s)":>8}')
+    for action, p in report['latency_s'].items():
+        if 'p50' not in p:
+            print(f'{action:>24} | {p["n"]:>5} |')
+            continue
+        print(f'{action:>24} | {p["n"]:>5} | {p["p50"]:>8.3f} | {p["p90"]:>8.3f} | {p["p99"]:>8.3f} | {p["max"]:>8.3f}')
+    print(f'\nserver RSS: {report["rss_start_MB"]:.0f} MB at start, {report["rss_peak_MB"]:.0f} MB peak ({report["rss_peak_per_session_MB"]:.1f} MB per session), {report["rss_end_MB"]:.0f} MB at end')
+    print(f'server CPU: {report["cpu_s"]:.1f} s ({report["cpu_per_session_s"]:.2f} s per session)')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Load test the dashboard server with simultaneous headless sessions.')
+    parser.add_argument('--sessions', type=int, default=20, help='number of simultaneous sessions.')
+    parser.add_argument('--actions', type=int, default=10, help='number of actions (datetime range changes, tab switches, Compare toggles) per session.')
+    parser.add_argument('--ramp', type=float, default=5, help='seconds over which the sessions connect.')
+    parser.add_argument('--app', default='instrument', help='dashboard app to load test.')
+    parser.add_argument('--no-compare', dest='compare', action='store_false', help='never turn on the Compare switch.')
+    parser.add_argument('--num-procs', type=int, default=1, help='number of server processes (see dashboard.py --num-procs).')
+    parser.add_argument('--port', type=int, default=5106, help='port to run the server on.')
+    parser.add_argument('--data', default=None, help='directory of (synthetic) data ending today. By default --days of synthetic data are written to a temporary directory.')
+    parser.add_argument('--days', type=int, default=14, help='number of days of synthetic data, from which the datetime ranges are chosen.')
+    parser.add_argument('--quiet', type=float, default=1., help='seconds without updates after which an action is considered complete.')
+    parser.add_argument('--poll', type=float, default=0.05, help='seconds between checks for updates from the server.')
+    parser.add_argument('--timeout', type=float, default=60., help='seconds to wait for the first update of an action.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', default=None, help='file to write the report to, as JSON.')
+    args = parser.parse_args()
+
+    report = run(args)
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,148 @@
+'''Author: Andrew Martin
+Creation Date: 18/10/26
+
+Script that writes synthetic daily data files for every instrument shown by the dashboard, with the variable names, dimensions and filename formats that the tabs and DataLoaders expect. The files are laid out in the same directories (relative to a data root) as the real data, so the dashboard and benchmarks can be run against them by setting the SLEIGH_DASHBOARD_DATA_ROOT environment variable (see DataLoader.data_path).
+
+The values are smooth random walks with a diurnal cycle, which is enough for the plots to look plausible and for compression, downsampling and aggregation to behave as they do with real data.
+
+Run with:
+    python benchmarks/synthetic.py /tmp/sleigh-data --start 2024-05-15 --days 7 [--instruments asfs cl61 ...]
+'''
+
+import argparse
+import datetime as dt
+import os
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+
+# (mean, amplitude) of the synthetic variables of each 1D instrument
+_asfs_vars = {
+    'sr30_swu_IrrC_mean': (150, 100), 'sr30_swd_IrrC_mean': (300, 200),
+    'ir20_lwu_Wm2_mean': (300, 20), 'ir20_lwd_Wm2_mean': (250, 40),
+    'fp_A_Wm2_mean': (0, 5), 'fp_B_Wm2_mean': (0, 5), 'fp_C_Wm2_mean': (0, 5),
+    'sr30_swu_fantach_mean': (5000, 100), 'sr30_swd_fantach_mean': (5000, 100),
+    'ir20_lwu_fan_mean': (5000, 100), 'ir20_lwd_fan_mean': (5000, 100),
+    'sr30_swu_heatA_mean': (10, 5), 'sr30_swd_heatA_mean': (10, 5),
+    'sr30_swu_tilt_mean': (1, 2), 'sr30_swd_tilt_mean': (179, 2),
+    'metek_InclX_mean': (0, 1), 'metek_InclY_mean': (0, 1),
+    'sr50_dist_mean': (1.5, 0.05),
+    'wspd_u_mean': (3, 3), 'wspd_v_mean': (1, 3), 'wspd_w_mean': (0, 0.2), 'wspd_vec_mean': (5, 3),
+    'wdir_vec_mean': (180, 90),
+    'vaisala_T_mean': (-15, 8), 'vaisala_P_mean': (680, 10), 'vaisala_RH_mean': (80, 10),
+    'skin_temp_mean': (-18, 10),
+}
+_turb_vars = {
+    'Hs_mean': (-10, 20), 'Hl_mean': (2, 5), 'bulk_Hs_mean': (-10, 20), 'bulk_Hl_mean': (2, 5),
+    'Cd_mean': (0.0015, 0.0005), 'bulk_Cd_mean': (0.0015, 0.0005),
+    'ustar_mean': (0.2, 0.1), 'bulk_ustar_mean': (0.2, 0.1),
+}
+_mvp_vars = {
+    'BatterySOC': (70, 20), 'BatteryVolts': (52, 2), 'WindVolts': (52, 2), 'BatteryWatts': (0, 300),
+    'SolarWatts_East': (300, 300), 'SolarWatts_South': (500, 400), 'SolarWatts_West': (300, 300),
+    'WindWatts': (200, 200), 'ACOutputWatts': (400, 100), 'DCInverterWatts': (450, 100),
+}
+_gfs_vars = {'Ts': (-15, 8), 'Ps': (680, 10), 'ws': (6, 4), 'wd': (180, 90), 'pr': (0.1, 0.1)}
+
+# the data of each instrument. Files are written to <data root>/<subdir>/<fname_fmt>, once for each hour in cycles of each day.
+#   freq: time resolution
+#   vars: 1D variables along time
+#   profile: (vertical dimension, its values, {2D variable: (mean, amplitude)}) for range-resolved instruments
+SCHEMAS = {
+    'asfs': {
+        'subdir': 'asfs', 'fname_fmt': 'summary_asfs_slow_%Y%m%d.nc', 'freq': '1min', 'vars': _asfs_vars,
+    },
+    'turb': {
+        'subdir': 'asfs', 'fname_fmt': 'summary_asfs_turb_%Y%m%d.nc', 'freq': '10min', 'vars': _turb_vars,
+    },
+    'cl61': {
+        'subdir': os.path.join('cl61', 'daily'), 'fname_fmt': 'summary_cl61_%Y%m%d.nc', 'freq': '1min', 'vars': {},
+        'profile': ('range', np.arange(0, 15360, 15.), {'beta_att_mean': (1e-6, 5e-7), 'linear_depol_ratio_median': (0.1, 0.05)}),
+    },
+    'mrr': {
+        'subdir': 'mrr', 'fname_fmt': 'summary_mrr_%Y%m%d.nc', 'freq': '1min', 'vars': {},
+        'profile': ('range_bins', np.arange(0, 128*30, 30.), {'Z_median': (5, 10), 'VEL_median': (1, 0.5), 'WIDTH_median': (0.3, 0.1)}),
+    },
+    'mwr': {
+        'subdir': 'mwr', 'fname_fmt': 'summary_mwr_%Y%m%d.nc', 'freq': '1min',
+        'vars': {'HKD_AlFl_sum': (0, 1), 'HKD_Rec1_T_mean': (30, 0.5), 'HKD_Rec2_T_mean': (30, 0.5)},
+        'profile': ('number_frequencies', np.arange(14), {'BRT_TBs_mean': (100, 50)}),
+    },
+    'gpr5': {
+        'subdir': 'gpr', 'fname_fmt': 'summary_gpr_5G_%Y%m%d.nc', 'freq': '10min', 'vars': {'f': (5, 1)},
+        'profile': ('step', np.arange(512), {'DM_mean': (0, 1), 'DM_std': (0.5, 0.2)}),
+    },
+    'gpr7': {
+        'subdir': 'gpr', 'fname_fmt': 'summary_gpr_7G_%Y%m%d.nc', 'freq': '10min', 'vars': {'f': (7, 1)},
+        'profile': ('step', np.arange(512), {'DM_mean': (0, 1), 'DM_std': (0.5, 0.2)}),
+    },
+    'simba': {
+        'subdir': 'simba', 'fname_fmt': 'summary_simba_%Y%m%d.nc', 'freq': '6h',
+        'vars': {'sample_span': (600, 10), 'battery_voltage': (12, 0.5), 'sample_start': (0, 60), 'sample_end': (600, 60), 'sample_number': (100, 50), 'sequence_number': (100, 50)},
+        'profile': ('height', np.arange(-100, 140, 2.), {'temperature': (-15, 10)}),
+    },
+    'mvp': {
+        'subdir': os.path.join('power', 'level2'), 'fname_fmt': 'power.mvp.level2.1min.%Y%m%d.000000.nc', 'freq': '1min', 'vars': _mvp_vars,
+    },
+    'gfs': {
+        'subdir': os.path.join('weather', 'GFS'), 'fname_fmt': 'Raven_GFS_Global_0p5deg_%Y%m%d_%H00.nc', 'cycles': [0, 6, 12, 18],
+        # each file is a forecast from its initialisation time, out to 16 days
+        'forecast': ('3h', 129), 'vars': _gfs_vars,
+    },
+}
+
+
+def _series(rng: np.random.Generator, time: pd.DatetimeIndex, mean: float, amplitude: float, shape: tuple[int] = ()) -> np.ndarray:
+    '''Returns a smooth random walk with a diurnal cycle along time (the first axis), of the given extra shape.'''
+    n = time.size
+    diurnal = np.sin(2*np.pi * (time.hour.values + time.minute.values/60) / 24)
+    walk = np.cumsum(rng.standard_normal((n, *shape)), axis=0) / np.sqrt(max(n, 1))
+    diurnal = diurnal.reshape(n, *[1]*len(shape))
+    return (mean + amplitude * (0.7*diurnal + 0.3*walk)).astype('float32')
+
+
+def make_dataset(instrument: str, start: dt.datetime, rng: np.random.Generator) -> xr.Dataset:
+    '''Returns a synthetic dataset for the file of instrument starting at start.'''
+    schema = SCHEMAS[instrument]
+    if 'forecast' in schema:
+        freq, periods = schema['forecast']
+        time = pd.date_range(start, periods=periods, freq=freq)
+    else:
+        time = pd.date_range(start, start + dt.timedelta(days=1), freq=schema['freq'], inclusive='left')
+
+    data_vars = {name: ('time', _series(rng, time, *ma)) for name, ma in schema['vars'].items()}
+    coords = {'time': time}
+    if 'profile' in schema:
+        dim, values, vars2d = schema['profile']
+        coords[dim] = values
+        for name, ma in vars2d.items():
+            data_vars[name] = (('time', dim), _series(rng, time, *ma, shape=(values.size,)))
+    return xr.Dataset(data_vars, coords=coords)
+
+
+def generate(root: str, start: dt.date, ndays: int, instruments: list[str] | None = None, seed: int = 0) -> None:
+    '''Writes ndays of synthetic files, starting on start, for each of instruments (default all of SCHEMAS) beneath root.'''
+    rng = np.random.default_rng(seed)
+    for instrument in instruments or SCHEMAS:
+        schema = SCHEMAS[instrument]
+        dir = os.path.join(root, schema['subdir'])
+        os.makedirs(dir, exist_ok=True)
+        for i in range(ndays):
+            for hour in schema.get('cycles', [0]):
+                t0 = dt.datetime.combine(start + dt.timedelta(days=i), dt.time(hour))
+                path = os.path.join(dir, t0.strftime(schema['fname_fmt']))
+                make_dataset(instrument, t0, rng).to_netcdf(path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Write synthetic instrument data for the dashboard.')
+    parser.add_argument('root', help='data root directory, to be used as SLEIGH_DASHBOARD_DATA_ROOT.')
+    parser.add_argument('--start', type=dt.date.fromisoformat, default=dt.date(2024, 5, 15), help='first day of data (YYYY-MM-DD).')
+    parser.add_argument('--days', type=int, default=7, help='number of days of data.')
+    parser.add_argument('--instruments', nargs='*', choices=list(SCHEMAS), default=None, help='instruments to write (default all).')
+    args = parser.parse_args()
+
+    generate(args.root, args.start, args.days, args.instruments)
+    print(f'synthetic.py: wrote {args.days} days of data to {args.root}, use it with SLEIGH_DASHBOARD_DATA_ROOT={args.root}')
@@ -1,17 +1,14 @@
 #!/usr/bin/env -S python3 -u
-import time, traceback, sys
+import time, traceback, sys, os
 
 from multiprocessing import Process
 
 import datetime  as dt
-import numpy     as np
-import pandas    as pd
-import xarray    as xr
-import holoviews as hv
 import panel     as pn
  
 from panel import HSpacer, Spacer
 
+import sleigh_dashboard
 import dashboard_instrument, dashboard_science
 
 pn.extension(design='material', template='material',
@@ -35,7 +32,8 @@ one_day = dt.timedelta(days=1)
 dtr = (dtr_end-one_day, dtr_end) # should start by first day of data
 dtp_args = {'value':dtr, 'start':start, 'end':end, 'name':''}
 
-# lambda functions to create panel entries
+# lambda functions to create panel entries. Each session gets its own Dashboard, but
+# create_dld() only hands out references to the DataLoader objects shared by the process
 db_instrument = \
     lambda: dashboard_instrument.dashboard_instruments(dtp_args,
                                                        dashboard_instrument.create_dld()
@@ -70,7 +68,7 @@ def print_traceback(tb, error_msg):
     print(f"!!! ———————————————————————————————————————————————————————— !!! " ,
           file=sys.stderr)
 
-def main(port=6646):
+def main(port=6646, num_procs=1, warmup_days=1, warmup_render=False):
     # delete / entry to get the index back 
     panel_dict = {
         '/' : db_instrument,
@@ -80,12 +78,30 @@ def main(port=6646):
 
     logo_image = "https://icecapsmelt.org/_image?href=%2F%40fs%2Fapp%2Fsrc%2Fassets%2Fimages%2Fgreenland_small.png"
 
-    server_thread = pn.serve(panel_dict,
-                             title='ICECAPS SLEIGH-MVP Dashboard',
-                             port=port,
-                             logo=logo_image,
-                             websocket_origin='*',
-                             show=False)
+    # time the serialisation of documents and updates sent to the sessions, see /metrics
+    sleigh_dashboard.Metrics.instrument_bokeh()
+    # /metrics and /metrics/spans, and the admin-only /profile
+    extra_patterns = sleigh_dashboard.Metrics.metrics_patterns + sleigh_dashboard.Profiler.profile_patterns
+
+    # with num_procs > 1 the server forks into several processes sharing the port, each with its own DataLoaders (and metrics)
+    server = pn.serve(panel_dict,
+                      title='ICECAPS SLEIGH-MVP Dashboard',
+                      port=port,
+                      logo=logo_image,
+                      websocket_origin='*',
+                      show=False,
+                      num_procs=num_procs,
+                      extra_patterns=extra_patterns,
+                      start=False)
+
+    # the port is bound by now (in each process), so the warm-up runs in the background while sessions are served
+    if warmup_days > 0:
+        sleigh_dashboard.Warmup.Warmup(dashboard_instrument.create_dld, warmup_days,
+                                       tabview_funcs=[dashboard_instrument.get_tabview, dashboard_science.get_tabview],
+                                       dtr=dtr, render=warmup_render).start()
+
+    server.start()
+    server.io_loop.start()
 
 # this runs the function main as the main program... functions
 # to come after the main code so it presents in a more logical, C-like, way
@@ -97,10 +113,32 @@ if __name__ == '__main__':
     import argparse
     parser = argparse.ArgumentParser(description='Run the dashboard to display the summarised data from the ICECAPS MELT Raven 2024 deployment.')
     parser.add_argument('-pd', action='store_true', help="Include this flag to chnage the port from 6646 (deployment) to 5006 (pre-deployment).")
+    parser.add_argument('--port', type=int, default=None, help="Port to serve the dashboard on, overriding -pd (e.g. for load testing, see benchmarks/loadtest.py).")
+    parser.add_argument('--memory-budget', type=float, default=None, help="Maximum size (in GB) of the data held in memory by all DataLoaders, after which the least recently used days are evicted. Defaults to 4 GB.")
+    parser.add_argument('--num-procs', type=int, default=1, help="Number of server processes (Unix only). Processes share the preprocessed data through memory-mapped files in --cache-dir, which is best placed on a tmpfs such as /dev/shm.")
+    parser.add_argument('--render-cache-size', type=int, default=None, help="Number of plots cached in memory and shared between sessions. Pass 0 to disable the cache. Defaults to 256.")
+    parser.add_argument('--cache-dir', default=os.path.expanduser('~/.cache/sleigh-dashboard'), help="Directory in which preprocessed data files are cached between restarts. Pass an empty string to disable the cache.")
+    parser.add_argument('--profile-dir', default=None, help="Directory in which profiles requested through /profile are written. Defaults to sleigh-dashboard-profiles in the temporary directory.")
+    parser.add_argument('--warmup-days', type=int, default=1, help="Number of days before today loaded into every DataLoader in the background when the server starts, so the first visitor doesn't wait for them. Pass 0 to disable the warm-up. Defaults to 1 (the default view).")
+    parser.add_argument('--warmup-render', action='store_true', help="Also plot the default view of each tab during the warm-up, so the first visitor's plots are served from the render cache.")
+    parser.add_argument('--cache-size', type=float, default=None, help="Maximum size (in GB) of --cache-dir, after which the least recently used files are removed from it. Defaults to 10 GB.")
     #parser.add_argument('')
     args = parser.parse_args()
     pd = args.pd
     if pd:
         PORT = 5006
+    if args.port is not None:
+        PORT = args.port
+    if args.memory_budget is not None:
+        sleigh_dashboard.DataLoader.set_memory_budget(int(args.memory_budget * 1024**3))
+    if args.num_procs > 1 and not args.cache_dir:
+        print('dashboard.py: --num-procs without a --cache-dir, each process will hold its own copy of the data')
+    # separate processes share the cached arrays by memory-mapping them
+    cache_size = sleigh_dashboard.DataLoader.DEFAULT_CHUNK_STORE_BYTES if args.cache_size is None else int(args.cache_size * 1024**3)
+    sleigh_dashboard.DataLoader.set_chunk_store(args.cache_dir or None, mmap=args.num_procs > 1, max_bytes=cache_size)
+    if args.render_cache_size is not None:
+        sleigh_dashboard.RenderCache.set_render_cache_size(args.render_cache_size)
+    if args.profile_dir is not None:
+        sleigh_dashboard.Profiler.set_profile_dir(args.profile_dir)
     
-    main(port=PORT)
+    main(port=PORT, num_procs=args.num_procs, warmup_days=args.warmup_days, warmup_render=args.warmup_render)
@@ -8,44 +8,43 @@ warnings.filterwarnings('once')
 
 import panel as pn
 import datetime as dt
-import hvplot.xarray
-import holoviews as hv
-import xarray as xr
-import numpy as np
 
 import traceback
 
 import sleigh_dashboard as dashboard
 import tabs.instrument
 
-# DataLoader objects need to be defined to control the dataflow in the program
-DL_asfs = tabs.instrument.tab_asfs.DL_asfs_slow
-DL_cl61 = tabs.instrument.tab_cl61.DL_cl61
-DL_gfs = tabs.instrument.tab_gfs.DL_gfs
-DL_gpr5 = tabs.instrument.tab_gpr.DL_gpr5
-DL_gpr7 = tabs.instrument.tab_gpr.DL_gpr7
-DL_mrr = tabs.instrument.tab_mrr.DL_mrr
-DL_mwr = tabs.instrument.tab_mwr.DL_mwr
-DL_mvp = tabs.instrument.tab_mvp.DL_mvp
-DL_simba = tabs.instrument.tab_simba.DL_simba
-DL_turb = tabs.instrument.tab_turb.DL_asfs_turb
+# DataLoader objects need to be defined to control the dataflow in the program.
+# The tab modules defining them (and the plotting libraries they import) are only imported once the first session creates them
+DL_asfs = lambda: tabs.instrument.tab_asfs.DL_asfs_slow()
+DL_cl61 = lambda: tabs.instrument.tab_cl61.DL_cl61()
+DL_gfs = lambda: tabs.instrument.tab_gfs.DL_gfs()
+DL_gpr5 = lambda: tabs.instrument.tab_gpr.DL_gpr5()
+DL_gpr7 = lambda: tabs.instrument.tab_gpr.DL_gpr7()
+DL_mrr = lambda: tabs.instrument.tab_mrr.DL_mrr()
+DL_mwr = lambda: tabs.instrument.tab_mwr.DL_mwr()
+DL_mvp = lambda: tabs.instrument.tab_mvp.DL_mvp()
+DL_simba = lambda: tabs.instrument.tab_simba.DL_simba()
+DL_turb = lambda: tabs.instrument.tab_turb.DL_asfs_turb()
 
 def create_dld():
+    '''Returns a dict of handles to the DataLoader objects required by the dashboard. The DataLoader objects themselves live in the process-wide DataLoaderRegistry, so every session shares the same loaded data.'''
+    registry = dashboard.DataLoaderRegistry.registry
     dld = {
-        'asfs': DL_asfs(),
-        'cl61': DL_cl61(),
-        'gfs': DL_gfs(),
-        'gpr5':DL_gpr5(),
-        'gpr7':DL_gpr7(), 
-        'mrr': DL_mrr(),
-        'mwr': DL_mwr(),
-        'mvp':DL_mvp(),
-        'simba':DL_simba(),
-        'turb':DL_turb()
+        'asfs': registry.get('asfs', DL_asfs),
+        'cl61': registry.get('cl61', DL_cl61),
+        'gfs': registry.get('gfs', DL_gfs),
+        'gpr5':registry.get('gpr5', DL_gpr5),
+        'gpr7':registry.get('gpr7', DL_gpr7), 
+        'mrr': registry.get('mrr', DL_mrr),
+        'mwr': registry.get('mwr', DL_mwr),
+        'mvp':registry.get('mvp', DL_mvp),
+        'simba':registry.get('simba', DL_simba),
+        'turb':registry.get('turb', DL_turb)
     }
     return dld
 
-def get_tabview(dld, augment) -> dashboard.TabView.TabView:
+def get_tabview(dld, augment) -> 'dashboard.TabView.TabView':
     tabview = dashboard.TabView.TabView(
         tablist=[
             #get_mvp_tab(augment),
@@ -9,10 +9,6 @@ warnings.filterwarnings('once')
 
 import panel as pn
 import datetime as dt
-import hvplot.xarray
-import holoviews as hv
-import xarray as xr
-import numpy as np
 
 import traceback
 
@@ -21,11 +17,7 @@ import tabs.science
 import tabs.instrument
 from dashboard_instrument import create_dld
 
-DL_asfs = tabs.instrument.tab_asfs.DL_asfs_slow
-
-dld = create_dld()
-
-def get_tabview(dld, augment) -> dashboard.TabView.TabView:
+def get_tabview(dld, augment) -> 'dashboard.TabView.TabView':
     tabview = dashboard.TabView.TabView(
         tablist=[
             #get_mvp_tab(augment),
@@ -64,6 +56,7 @@ def serve_dashboard_science(dld):
     return serve
 
 if __name__ == '__main__':
+    dld = create_dld()
     db_func = serve_dashboard_science(dld)
  
     logo_image = "https://icecapsmelt.org/_image?href=%2F%40fs%2Fapp%2Fsrc%2Fassets%2Fimages%2Fgreenland_small.png"
@@ -0,0 +1,209 @@
+'''Author: Andrew Martin
+Creation Date: 18/10/26
+
+Script for the ChunkStore class, a persistent on-disk cache of preprocessed DataLoader chunks. Each entry is the output of a DataLoader's file_preproc for a single file, stored as one decoded .npy array per variable plus a small metadata file. Entries are keyed by the source file path, its mtime and size, and a hash of the source of the module defining the preprocessing function (so edits to the helpers it calls are also picked up), so a changed file or a changed preproc never reads a stale entry. The total size of the store is capped, and the least recently used entries are removed once it is exceeded.
+
+Reading an entry is a handful of np.load calls, which avoids both the netCDF decoding and the preprocessing of the source file after a server restart. With mmap=True the arrays are memory-mapped instead of read, so several server processes using the same store (ideally on a tmpfs such as /dev/shm) share one copy of each array through the page cache. Processes coordinate with a lock file per source file, so each file is only decoded by one of them.
+'''
+
+import hashlib
+import inspect
+import os
+import pickle
+import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+import numpy as np
+import xarray as xr
+
+try:
+    import fcntl
+except ImportError:
+    # not available on Windows, where processes don't coordinate their writes
+    fcntl = None
+
+# default maximum total size of the entries of a ChunkStore, in bytes
+DEFAULT_MAX_BYTES = 10 * 1024**3
+
+
+def func_hash(func: callable) -> str:
+    '''Returns a hash identifying the code of func, which changes whenever the source of the module defining it is edited. The whole module is hashed, as func may call other functions of the module (e.g. preproc_GFS calls recency_alpha).'''
+    try:
+        code = inspect.getsource(inspect.getmodule(func))
+    except (OSError, TypeError):
+        try:
+            code = inspect.getsource(func)
+        except (OSError, TypeError):
+            code = getattr(getattr(func, '__code__', None), 'co_code', repr(func))
+    ident = f'{getattr(func, "__module__", "")}.{getattr(func, "__qualname__", "")}:{code}'
+    return hashlib.sha1(ident.encode()).hexdigest()
+
+
+class ChunkStore:
+    '''ChunkStore is a directory of cached, preprocessed datasets, laid out as
+
+        <root>/<loader name>/<source filename>.<key>/{meta.pkl, 0.npy, 1.npy, ...}
+
+    ATTRIBUTES:
+        root: str
+        min_age: float
+            files modified less than min_age seconds ago are still being written to, and are not cached
+        mmap: bool
+            if True, arrays are memory-mapped (read-only) rather than read into memory
+        max_bytes: int | None
+            maximum total size of the entries, after which the least recently used entries are removed. If None, the size isn't limited
+
+    METHODS:
+        key
+        get
+        put
+        lock
+        enforce
+    '''
+
+    def __init__(self, root: str, min_age: float = 3600, mmap: bool = False, max_bytes: int | None = DEFAULT_MAX_BYTES):
+        self.root = root
+        self.min_age = min_age
+        self.mmap = mmap
+        self.max_bytes = max_bytes
+        # estimated total size of the entries (other processes may also write to the store), None until the store is first scanned
+        self._nbytes = None
+        self._lock = threading.Lock()
+
+    def __getstate__(self) -> dict:
+        # the store is sent to the workers of process pools (see DataLoader._read_file), which keep their own lock and size estimate
+        state = dict(self.__dict__)
+        del state['_lock']
+        state['_nbytes'] = None
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def key(self, path: str, st: os.stat_result, file_preproc: callable, sortby_dim: str) -> str:
+        '''Returns the cache key for the file at path, with stat result st, preprocessed by file_preproc.'''
+        ident = f'{os.path.abspath(path)}|{st.st_mtime_ns}|{st.st_size}|{func_hash(file_preproc)}|{sortby_dim}'
+        return hashlib.sha1(ident.encode()).hexdigest()[:20]
+
+    def _entry_dir(self, name: str, fname: str, key: str) -> str:
+        return os.path.join(self.root, name, f'{fname}.{key}')
+
+    def get(self, name: str, fname: str, key: str) -> tuple[xr.Dataset, object] | None:
+        '''Returns the cached (dataset, last refresh value) for the entry, or None if it doesn't exist or can't be read.'''
+        entry = self._entry_dir(name, fname, key)
+        try:
+            with open(os.path.join(entry, 'meta.pkl'), 'rb') as f:
+                meta = pickle.load(f)
+            variables = {
+                vname: xr.Variable(dims, self._load_array(os.path.join(entry, f'{i}.npy')), attrs)
+                for i, (vname, dims, attrs) in enumerate(meta['variables'])
+            }
+        except Exception:
+            # missing, or written by an incompatible version
+            return None
+        # the modification time of an entry records when it was last used (see enforce)
+        try:
+            os.utime(entry)
+        except OSError:
+            pass
+        coords = {k: v for k, v in variables.items() if k in meta['coords']}
+        data_vars = {k: v for k, v in variables.items() if k not in meta['coords']}
+        return xr.Dataset(data_vars, coords=coords, attrs=meta['attrs']), meta['last']
+
+    def _load_array(self, path: str) -> np.ndarray:
+        return np.load(path, mmap_mode='r' if self.mmap else None, allow_pickle=False)
+
+    @contextmanager
+    def lock(self, name: str, fname: str):
+        '''Context manager holding an exclusive lock for the entries of fname, shared between processes. A process that is about to read and cache fname holds the lock, so that others wait for its entry rather than decoding the file themselves.'''
+        if fcntl is None:
+            yield
+            return
+        parent = os.path.join(self.root, name)
+        os.makedirs(parent, exist_ok=True)
+        with open(os.path.join(parent, f'.{fname}.lock'), 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def put(self, name: str, fname: str, key: str, ds: xr.Dataset, last=None) -> bool:
+        '''Writes ds (and the last refresh value) as the entry for key, replacing any older entries for fname. Datasets containing object arrays can't be stored, and are skipped. Returns whether the entry was written.'''
+        if any(v.dtype == object for v in ds.variables.values()):
+            return False
+        entry = self._entry_dir(name, fname, key)
+        if os.path.isdir(entry):
+            return True
+        parent = os.path.dirname(entry)
+        os.makedirs(parent, exist_ok=True)
+
+        # write to a temporary directory and rename it, so a partially written entry is never read
+        tmp = os.path.join(parent, f'.tmp-{uuid.uuid4().hex}')
+        os.makedirs(tmp)
+        try:
+            meta = {'variables': [], 'coords': set(ds.coords), 'attrs': dict(ds.attrs), 'last': last}
+            for i, (vname, var) in enumerate(ds.variables.items()):
+                np.save(os.path.join(tmp, f'{i}.npy'), np.asarray(var.values), allow_pickle=False)
+                meta['variables'].append((vname, var.dims, dict(var.attrs)))
+            with open(os.path.join(tmp, 'meta.pkl'), 'wb') as f:
+                pickle.dump(meta, f)
+            os.rename(tmp, entry)
+        except OSError:
+            # another process may have written the same entry first
+            shutil.rmtree(tmp, ignore_errors=True)
+            return os.path.isdir(entry)
+
+        self._prune(parent, fname, keep=os.path.basename(entry))
+        with self._lock:
+            if self._nbytes is not None:
+                self._nbytes += _dir_size(entry)
+        self.enforce(keep=entry)
+        return True
+
+    def enforce(self, keep: str | None = None) -> None:
+        '''Removes the least recently used entries (other than the entry directory keep) until the store is within max_bytes. Arrays that are memory-mapped by a process stay readable by it after their entry is removed.'''
+        if self.max_bytes is None: return
+        with self._lock:
+            if self._nbytes is not None and self._nbytes <= self.max_bytes: return
+            entries = []
+            for name in _listdir(self.root):
+                parent = os.path.join(self.root, name)
+                for d in _listdir(parent):
+                    path = os.path.join(parent, d)
+                    if d.startswith('.') or not os.path.isdir(path): continue
+                    try:
+                        entries.append((os.stat(path).st_mtime, _dir_size(path), path))
+                    except OSError:
+                        continue
+            self._nbytes = sum(nbytes for _, nbytes, _ in entries)
+            for _, nbytes, path in sorted(entries):
+                if self._nbytes <= self.max_bytes: break
+                if path == keep: continue
+                print(f'ChunkStore.enforce: removing {path}')
+                shutil.rmtree(path, ignore_errors=True)
+                self._nbytes -= nbytes
+
+    def _prune(self, parent: str, fname: str, keep: str) -> None:
+        '''Removes the entries of fname other than keep, which are for older versions of the file or preproc.'''
+        for d in os.listdir(parent):
+            if d.startswith(f'{fname}.') and d != keep and not d.endswith('.lock'):
+                shutil.rmtree(os.path.join(parent, d), ignore_errors=True)
+
+    def is_settled(self, st: os.stat_result) -> bool:
+        '''Whether a file with stat result st is old enough to be cached.'''
+        return time.time() - st.st_mtime > self.min_age
+
+
+def _listdir(path: str) -> list[str]:
+    try:
+        return os.listdir(path)
+    except OSError:
+        return []
+
+def _dir_size(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(path, f)) for f in _listdir(path))
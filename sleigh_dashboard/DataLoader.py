@@ -2,25 +2,226 @@
 Creation Date: 15/4/24
 
 Script for the DataLoader class, which will contain the logic to load data and serve data within given datetime ranges.
+
+Loaded data is held as one chunk per data file (i.e. per day for the daily summary files), kept in a day-ordered index so that a datetime range is served by combining only the chunks that overlap it. Files from the current day are checked for changes each time they are served, and only the newly appended entries are read. Optionally, each chunk is also kept at coarser time resolutions (a pyramid of mean/min/max aggregates), which are served for long datetime ranges. If a chunk_store is set, preprocessed files are also cached on disk (see ChunkStore), so they don't need decoding and preprocessing again after a restart. The memory used by the chunks of every DataLoader in the process is tracked by a single MemoryBudget, which evicts the least recently used chunks once its byte limit is exceeded. Evicted chunks are reloaded from disk the next time they are requested.
 '''
 
 import datetime as dt
 import xarray as xr
+import pandas as pd
+import numpy as np
 import os
+import threading
+import asyncio
+import bisect
+import contextvars
+import functools
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from .DirectoryIndex import DirectoryIndex
+from .ChunkStore import ChunkStore, DEFAULT_MAX_BYTES as DEFAULT_CHUNK_STORE_BYTES
+from .Metrics import metrics, tags
+
+# default size of the process-wide memory budget, in bytes
+DEFAULT_MEMORY_BUDGET = 4 * 1024**3
+
+# environment variable setting the directory containing the instrument data (see data_path)
+DATA_ROOT_ENV = 'SLEIGH_DASHBOARD_DATA_ROOT'
+DEFAULT_DATA_ROOT = '/data'
+
+def data_path(*parts: str) -> str:
+    '''Returns the path of parts within the instrument data directory, which is /data unless the SLEIGH_DASHBOARD_DATA_ROOT environment variable is set (e.g. to a directory of synthetic data, see benchmarks/synthetic.py).'''
+    return os.path.join(os.environ.get(DATA_ROOT_ENV, DEFAULT_DATA_ROOT), *parts)
+
+def _identity(ds: xr.Dataset) -> xr.Dataset:
+    '''Default file_preproc. A module-level function rather than a lambda, so that it can be sent to a process pool.'''
+    return ds
+
+
+class DataChunk:
+    '''DataChunk holds the (preprocessed) data loaded from a single file, the day of the file, and the state of the file when it was read.
+
+    ATTRIBUTES:
+        fname: str
+        day: dt.date
+        data: xr.Dataset
+        nbytes: int
+        stat: tuple[int, int]
+            (mtime in ns, size in bytes) of the file when it was last read
+        last: np.datetime64 | None
+            last value of the DataLoader's refresh_dim in the file when it was last read
+        levels: dict[str: xr.Dataset]
+            time-aggregated versions of data, keyed by resampling frequency (see build_levels)
+    '''
+
+    def __init__(self, fname: str, day: dt.date, data: xr.Dataset, stat: tuple[int, int] = (0, 0), last = None):
+        self.fname = fname
+        self.day = day
+        self.stat = stat
+        self.last = last
+        self.set_data(data)
+
+    def set_data(self, data: xr.Dataset, levels: dict[str: xr.Dataset] = {}) -> None:
+        self.data = data
+        self.levels = dict(levels)
+        # only count the variables that are actually held in this process's memory, not lazy (dask-backed) or memory-mapped (shared, see ChunkStore) ones
+        self.nbytes = int(sum(
+            v.nbytes for ds in [data, *self.levels.values()] for v in ds.variables.values()
+            if v.chunks is None and not isinstance(v.data, np.memmap)
+        ))
+
+
+def build_levels(ds: xr.Dataset, dim: str, freqs: list[str], aggregates: dict[str: str] = {}) -> dict[str: xr.Dataset]:
+    '''Returns aggregated versions of ds along dim for each resampling frequency in freqs. Each numeric variable along dim is replaced by its mean over each interval (or the aggregate given for it in aggregates, one of 'mean', 'sum', 'min' or 'max', e.g. 'sum' for counts), and <variable>_min and <variable>_max variables are added with the extremes (NaNs are ignored). Variables without dim are kept as they are.
+
+    ds must be sorted along dim, so that each interval is a contiguous segment and can be reduced with np.ufunc.reduceat rather than a groupby.
+    '''
+    numeric = [v for v, da in ds.data_vars.items() if dim in da.dims and da.dtype.kind in 'iuf']
+    others = {v: da for v, da in ds.data_vars.items() if dim not in da.dims}
+    coords = {c: da for c, da in ds.coords.items() if dim not in da.dims}
+    times = pd.DatetimeIndex(ds[dim].values)
+
+    levels = {}
+    for freq in freqs:
+        labels = times.floor(freq).values
+        starts = np.flatnonzero(np.r_[True, labels[1:] != labels[:-1]]) if labels.size else np.array([], dtype=int)
+        level = {}
+        for v in numeric:
+            da = ds[v]
+            axis = da.get_axis_num(dim)
+            x = da.values.astype(float)
+            if starts.size:
+                valid = ~np.isnan(x)
+                counts = np.add.reduceat(valid, starts, axis=axis)
+                x_sum = np.where(counts > 0, np.add.reduceat(np.where(valid, x, 0), starts, axis=axis), np.nan)
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    mean = x_sum / counts
+                x_min = np.fmin.reduceat(x, starts, axis=axis)
+                x_max = np.fmax.reduceat(x, starts, axis=axis)
+            else:
+                mean = x_sum = x_min = x_max = x
+            aggregate = {'mean': mean, 'sum': x_sum, 'min': x_min, 'max': x_max}[aggregates.get(v, 'mean')]
+            level[v] = xr.Variable(da.dims, aggregate, da.attrs)
+            level[f'{v}_min'] = xr.Variable(da.dims, x_min, da.attrs)
+            level[f'{v}_max'] = xr.Variable(da.dims, x_max, da.attrs)
+        levels[freq] = xr.Dataset(
+            {**level, **others},
+            coords={**coords, dim: labels[starts] if labels.size else labels},
+            attrs=ds.attrs
+        )
+    return levels
+
+
+class MemoryBudget:
+    '''MemoryBudget tracks the size and usage of the DataChunk objects held by every DataLoader in the process. When the total size exceeds max_bytes, the least recently used chunks are evicted from their DataLoader.
+
+    ATTRIBUTES:
+        max_bytes: int
+        nbytes: int
+
+    METHODS:
+        touch
+        discard
+        enforce
+        usage_by_loader
+    '''
+
+    def __init__(self, max_bytes: int = DEFAULT_MEMORY_BUDGET):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        # (id(loader), fname) -> (loader, nbytes), ordered from least to most recently used
+        self._usage = OrderedDict()
+        self._lock = threading.Lock()
+
+    def touch(self, loader, fname: str, nbytes: int | None = None) -> None:
+        '''Marks the chunk fname of loader as most recently used. If nbytes is given, the chunk is (re)registered with that size.'''
+        key = (id(loader), fname)
+        with self._lock:
+            if nbytes is not None:
+                if key in self._usage:
+                    self.nbytes -= self._usage[key][1]
+                self._usage[key] = (loader, nbytes)
+                self.nbytes += nbytes
+            if key in self._usage:
+                self._usage.move_to_end(key)
+
+    def discard(self, loader, fname: str) -> None:
+        '''Stops tracking the chunk fname of loader.'''
+        with self._lock:
+            _, nbytes = self._usage.pop((id(loader), fname), (None, 0))
+            self.nbytes -= nbytes
+
+    def enforce(self) -> None:
+        '''Evicts least recently used chunks until the tracked size is within max_bytes.
+
+        NOTE: this must not be called while holding a DataLoader lock, as evicting a chunk requires the lock of the DataLoader that holds it.
+        '''
+        victims = []
+        with self._lock:
+            while self.nbytes > self.max_bytes and self._usage:
+                (_, fname), (loader, nbytes) = self._usage.popitem(last=False)
+                self.nbytes -= nbytes
+                victims.append((loader, fname))
+        for loader, fname in victims:
+            loader._evict(fname)
+
+    def usage_by_loader(self) -> dict[str: int]:
+        '''Returns the number of tracked bytes for each DataLoader, keyed by DataLoader name.'''
+        usage = {}
+        with self._lock:
+            for loader, nbytes in self._usage.values():
+                usage[loader.name] = usage.get(loader.name, 0) + nbytes
+        return usage
+
+
+# the memory budget shared by every DataLoader in the process
+memory_budget = MemoryBudget()
+
+def _collect_memory_usage(m) -> None:
+    '''Sets the gauges of the memory used by each DataLoader, when the metrics are rendered.'''
+    m.set_gauge('sleigh_memory_budget_bytes', memory_budget.max_bytes, 'Size of the memory budget shared by the DataLoaders.')
+    for name, nbytes in memory_budget.usage_by_loader().items():
+        m.set_gauge('sleigh_loaded_bytes', nbytes, 'Bytes of data held in memory by each DataLoader.', loader=name)
+
+metrics.add_collector(_collect_memory_usage)
+
+def set_memory_budget(max_bytes: int) -> None:
+    '''Sets the size of the process-wide memory budget, evicting chunks if the new budget is already exceeded.'''
+    memory_budget.max_bytes = max_bytes
+    memory_budget.enforce()
+
+
+# the on-disk cache of preprocessed files used by every DataLoader in the process, disabled if None
+chunk_store = None
+
+def set_chunk_store(root: str | None, mmap: bool = False, max_bytes: int | None = DEFAULT_CHUNK_STORE_BYTES) -> None:
+    '''Sets the directory of the process-wide ChunkStore, or disables it if root is None. If mmap is True, cached arrays are memory-mapped, so that processes using the same root share them. The store is limited to max_bytes (unlimited if None).'''
+    global chunk_store
+    chunk_store = None if root is None else ChunkStore(root, mmap=mmap, max_bytes=max_bytes)
+
 
 class DataLoader:
     '''DataLoader is a class that loads .nc files from a specific directory with a given filename format. The class can be provided with a datetime range, from which the data is loaded (rather than lodading all available files).
+
+    Each loaded file is stored as a DataChunk, and every chunk is registered with the process-wide memory_budget, which may evict it again if other data is used more recently.
     
     ATTRIBUTES:
         name: str
         dir: str
         fname_fmt: str
         sortby_dim: str
+        chunks: dict[str: DataChunk]
         loaded_files: list[str]
         data: xr.Dataset
+        nbytes: int
+        version: int
 
     METHODS:
         __call__
+        versioned_data
+        fetch
         update_data
         _get_files_in_dtr
     '''
@@ -32,7 +233,16 @@ class DataLoader:
         init_dtr: tuple[dt.datetime, dt.datetime] | None = None,
         sortby_dim: str = 'time',
         concat_dim: str | None = None,
-        file_preproc: callable = (lambda x: x)
+        file_preproc: callable = _identity,
+        refresh_dim: str | None = 'time',
+        lazy: bool = False,
+        dask_chunks: dict | str = {},
+        max_workers: int = 1,
+        executor: str = 'thread',
+        pyramid: list[str] | None = None,
+        pyramid_min_points: int = 1000,
+        pyramid_aggregates: dict[str: str] = {},
+        view_cache_size: int = 4
     ):
         '''Initilisation function. Requires a dataloader name, directory and filename format.
         
@@ -44,7 +254,7 @@ class DataLoader:
                 string describing the path to the directory containing the data to be loaded
 
             fname_fmt: str
-                filename format for the data to be loaded. Requires datetime accessors at the  -day resolution.
+                filename format for the data to be loaded. Requires datetime accessors at the  -day resolution. Glob-like wildcards (* and ?) may be used for parts of the filename that vary within a day.
 
             init_dtr: tuple[dt.datetime, dt.datetime] | None
                 Either, a sorted tuple of datetime objects describing a left-inclusive datetime range, or None. If None, no data will be loaded on initialisation.
@@ -57,12 +267,39 @@ class DataLoader:
 
             file_preproc: callable[xr.Dataset] -> xr.Dataset
                 Function that accepts an xarray dataset, returns an xarray dataset, ad is applied to each file before they are combined along combine_dim. The default is to apply no preprocessing.
+
+            refresh_dim: str | None
+                dimension of the (un-preprocessed) files along which they grow. When a recent file changes on disk, only the entries along refresh_dim after those already loaded are read, preprocessed and appended. If None, a changed file is reloaded in full.
+
+            lazy: bool
+                If True, files are opened as dask-backed datasets rather than loaded into memory. Only the variables and datetime range that are actually plotted are then read from disk. Intended for large 2D (e.g. range-resolved) datasets, of which most variables are never plotted.
+
+            dask_chunks: dict | str
+                chunks argument passed to xr.open_dataset when lazy is True. The default, {}, uses the chunking of the files on disk.
+
+            max_workers: int
+                number of files that are read and preprocessed concurrently when several files need loading at once. The default, 1, loads files one at a time.
+
+            executor: str
+                either 'thread' or 'process', the kind of worker pool used when max_workers > 1. Reads of netCDF files are serialised between threads by the HDF5 library, so a process pool gives more parallelism, but requires file_preproc to be picklable (i.e. a module-level function). Lazy DataLoaders always use threads.
+
+            pyramid: list[str] | None
+                resampling frequencies (e.g. ['10min', '1h']) at which each chunk is also stored as mean, min and max aggregates along sortby_dim. When called, the coarsest level that still gives pyramid_min_points over the requested range is served instead of the full resolution data. If None, the full resolution data is always served. Not intended for lazy DataLoaders.
+
+            pyramid_min_points: int
+                the minimum number of points along sortby_dim that a pyramid level must give over the requested range to be served.
+
+            pyramid_aggregates: dict[str: str]
+                aggregate used for variables of the pyramid levels that shouldn't be averaged, e.g. {'count': 'sum'} (see build_levels). Variables not given are averaged.
+
+            view_cache_size: int
+                number of served views (datetime range, augmented or not) kept until the loaded data changes, so that tabs and sessions showing the same range share one combined dataset.
         '''
         self.name = name
         self.dir = dir
         self.fname_fmt = fname_fmt
-        self.data = None
-        self.loaded_files = []
+        self.dir_index = DirectoryIndex(dir, fname_fmt)
+        self.chunks = {}
         self.sortby_dim = sortby_dim
 
         if concat_dim is None:
@@ -70,15 +307,50 @@ class DataLoader:
         self.concat_dim = concat_dim    
         
         self.file_preproc = file_preproc
+        self.refresh_dim = refresh_dim
+        self.lazy = lazy
+        self.dask_chunks = dask_chunks
+        self.max_workers = max_workers
+        self.executor = 'thread' if lazy else executor
+        # sorted from finest to coarsest
+        self.pyramid = sorted(pyramid or [], key=pd.to_timedelta)
+        self.pyramid_min_points = pyramid_min_points
+        self.pyramid_aggregates = pyramid_aggregates
+        self.memory_budget = memory_budget
+
+        # a single DataLoader can be shared between several dashboard sessions (see DataLoaderRegistry), so loading and slicing is serialised
+        self._lock = threading.RLock()
+        # sorted list of (day, fname) for every loaded chunk, used to find the chunks that overlap a datetime range
+        self._index = []
+        # incremented whenever loaded data is added or changed, so that anything made from the served data (e.g. cached plots, see RenderCache) can tell that it is out of date
+        self.version = 0
+        # the most recently served views, {(start, end, augment): (version, xr.Dataset)}
+        self._views = OrderedDict()
+        self.view_cache_size = view_cache_size
 
         if init_dtr is not None:
             self.update_data(init_dtr)
 
+    @property
+    def loaded_files(self) -> list[str]:
+        return [f for _, f in self._index]
+
+    @property
+    def nbytes(self) -> int:
+        '''Current size of the data held in memory by the DataLoader, in bytes.'''
+        return sum(c.nbytes for c in list(self.chunks.values()))
+
+    @property
+    def data(self) -> xr.Dataset | None:
+        '''All of the currently loaded chunks, combined along concat_dim.'''
+        with self._lock:
+            return self._assemble([self.chunks[f] for _, f in self._index])
+
     def __call__(self, 
         dtr: tuple[dt.datetime, dt.datetime],
         augment=False
     ) -> xr.Dataset:
-        '''When called, the DataLoader updates its data based on the given datetime range and returns the appropriately sliced data.
+        '''When called, the DataLoader updates its data based on the given datetime range and returns the appropriately sliced data. Only the chunks that overlap dtr are combined. If the DataLoader has a pyramid, the coarsest level that gives enough points over dtr is served (see select_level).
         
         dtr: tuple[dt.datetime, dt.datetime]
             tuple containing the start and end datetime objects of the range of data to be served.
@@ -86,66 +358,321 @@ class DataLoader:
         augment: bool
             If true, change all of the dimension, coordinate and variables names to contain a trailing underscore, so that shared_axes is broken between augmented and non-augmented plots on the Dashboard.
         '''
-        self.update_data(dtr)
-        if self.data is not None:
-            tslice = slice(*dtr, None)
-            selarg = {self.sortby_dim: tslice}
-            ds = self.data.sel(**selarg)
+        return self.versioned_data(dtr, augment)[0]
+
+    def versioned_data(self,
+        dtr: tuple[dt.datetime, dt.datetime],
+        augment=False
+    ) -> tuple[xr.Dataset, int]:
+        '''Same as calling the DataLoader, but also returns the version of the loaded data that the returned dataset was made from.'''
+        with self._lock, tags(loader=self.name):
+            with metrics.span('update_data'):
+                self._update_data(dtr)
+            version = self.version
+            ds = self._view(dtr, augment)
+        # evicting chunks needs the locks of other DataLoaders, so it is done once this one has been released
+        self.memory_budget.enforce()
+        # a shallow copy shares the view's data, but keeps changes made by the caller (e.g. adding variables) out of the cached view
+        if ds is not None: ds = ds.copy(deep=False)
+        return ds, version
+
+    async def fetch(self,
+        dtr: tuple[dt.datetime, dt.datetime],
+        augment=False
+    ) -> tuple[xr.Dataset, int]:
+        '''Asynchronous version of versioned_data. Reading files blocks, so it is run in the event loop's default executor, and the event loop (which serves the widgets and websockets of every session) keeps running while the data loads.'''
+        loop = asyncio.get_running_loop()
+        # the executor doesn't run functions in the caller's context, so the metrics tags (e.g. tab and session) are copied over
+        ctx = contextvars.copy_context()
+        return await loop.run_in_executor(None, functools.partial(ctx.run, self.versioned_data, dtr, augment))
 
-            if augment: 
+    def _view(self,
+        dtr: tuple[dt.datetime, dt.datetime],
+        augment: bool = False
+    ) -> xr.Dataset | None:
+        '''Returns the data within dtr, from the view cache if the loaded data hasn't changed since it was made. The augmented view is made from the cached primary view by renaming, which doesn't copy any data, so Compare mode serves the same arrays as the primary view.'''
+        key = (pd.Timestamp(dtr[0]), pd.Timestamp(dtr[1]), augment)
+        entry = self._views.get(key)
+        if entry is not None and entry[0] == self.version:
+            self._views.move_to_end(key)
+            metrics.cache_request('view', True, loader=self.name)
+            return entry[1]
+        metrics.cache_request('view', False, loader=self.name)
+
+        if augment:
+            ds = self._view(dtr, False)
+            if ds is not None:
                 ds = ds.rename_dims({k:k+'_' for k in ds.dims})
                 ds = ds.rename_vars({k:k+'_' for k in ds.coords})
-            return ds
+        else:
+            with metrics.span('slice'):
+                ds = self._assemble(self._select_chunks(dtr), self.select_level(dtr))
+                if ds is not None:
+                    ds = self._slice(ds, dtr)
+
+        self._views[key] = (self.version, ds)
+        self._views.move_to_end(key)
+        while len(self._views) > self.view_cache_size:
+            self._views.popitem(last=False)
+        return ds
+
+    def _slice(self,
+        ds: xr.Dataset,
+        dtr: tuple[dt.datetime, dt.datetime]
+    ) -> xr.Dataset:
+        '''Returns the part of ds (combined from the chunks selected for dtr) that is served for dtr.'''
+        tslice = slice(*dtr, None)
+        selarg = {self.sortby_dim: tslice}
+        return ds.sel(**selarg)
+
+    def select_level(self,
+        dtr: tuple[dt.datetime, dt.datetime]
+    ) -> str | None:
+        '''Returns the coarsest pyramid level with at least pyramid_min_points intervals within dtr, or None if the full resolution data is required.'''
+        span = pd.Timestamp(dtr[1]) - pd.Timestamp(dtr[0])
+        for freq in reversed(self.pyramid):
+            if span / pd.to_timedelta(freq) >= self.pyramid_min_points:
+                return freq
         return None
 
     def update_data(self,
         dtr: tuple[dt.datetime, dt.datetime]
     ) -> None:
-        '''Function that takes a datetime range, and updates the DataLoaders stored data attribute if the requested data isn't already loaded.'''
+        '''Function that takes a datetime range, and loads the chunks for any files in that range that aren't already loaded.'''
+        with self._lock, tags(loader=self.name), metrics.span('update_data'):
+            self._update_data(dtr)
+        self.memory_budget.enforce()
+
+    def _update_data(self,
+        dtr: tuple[dt.datetime, dt.datetime]
+    ) -> None:
         print(f'DataLoader {self.name}.update_data: called')
         # get all the required files for loading the datetime range
         flist_dtr = self._get_files_from_dtr(dtr)
-        flist_to_load = [f for f in flist_dtr if f not in self.loaded_files]
+        # files from the last couple of days may still be being written to
+        live_day = dt.datetime.now(dt.timezone.utc).date() - dt.timedelta(days=1)
+        for day, f in flist_dtr:
+            if f not in self.chunks: continue
+            self.memory_budget.touch(self, f)
+            if day >= live_day: self._refresh_chunk(self.chunks[f])
+        flist_to_load = [(day, f) for day, f in flist_dtr if f not in self.chunks]
         # exit if there are no files to load
         if not flist_to_load: return
 
-        flist_in_dir = os.listdir(self.dir)
-        flist_to_load = [f for f in flist_to_load if f in flist_in_dir]
-        if not flist_to_load: return
+        flist_to_load = sorted(flist_to_load)
+        if self.max_workers > 1 and len(flist_to_load) > 1:
+            # read the files concurrently, then add the chunks in order
+            pool = _get_pool(self.executor, self.max_workers)
+            futures = [
+                (day, f, self._submit(pool, _read_file, os.path.join(self.dir, f), *self._read_args()))
+                for day, f in flist_to_load
+            ]
+            for day, f, future in futures:
+                try:
+                    self._add_chunk(DataChunk(f, day, *future.result()))
+                except Exception as e:
+                    _print_load_error(f, e)
+            return
 
-        ds_to_merge = []
-        if self.data is not None: ds_to_merge = [self.data]
-
-        for f in sorted(flist_to_load):
+        for day, f in flist_to_load:
             try:
-                ds_to_merge.append( 
-                    self.file_preproc(
-                        xr.load_dataset(os.path.join( self.dir, f ))
-                    ) 
-                )
-                self.loaded_files.append(f)
+                self._add_chunk(self._load_chunk(day, f))
             except Exception as e:
-                print('!!! ' + '='*44 + ' !!!')
-                print(f'DATALOADER ERROR: failed to load {f}')
-                print(e)
-                print('!!! ' + '-'*44 + ' !!!')
-
-        # TODO: assess if coords='minimal' causes issues
-        self.data = xr.concat(ds_to_merge, dim=self.concat_dim, coords='minimal').sortby(self.sortby_dim)
+                _print_load_error(f, e)
         return
 
+    def _submit(self, pool, func: callable, *args):
+        '''Submits func(*args) to pool. Functions run in a thread pool are run in a copy of the current context, so that their metrics spans have the same tags.'''
+        if self.executor == 'process':
+            return pool.submit(func, *args)
+        return pool.submit(contextvars.copy_context().run, func, *args)
+
+    def _read_args(self) -> tuple:
+        return (self.file_preproc, self.sortby_dim, self.refresh_dim, self.lazy, self.dask_chunks, chunk_store, self.name)
+
+    def _load_chunk(self, day: dt.date, fname: str) -> DataChunk:
+        '''Reads and preprocesses the whole of fname.'''
+        return DataChunk(fname, day, *_read_file(os.path.join(self.dir, fname), *self._read_args()))
+
+    def _refresh_chunk(self, chunk: DataChunk) -> None:
+        '''Checks whether the file of chunk has changed since it was read. If it has grown along refresh_dim, only the new entries are read, preprocessed and appended to the chunk; otherwise the file is reloaded in full.'''
+        path = os.path.join(self.dir, chunk.fname)
+        try:
+            st = os.stat(path)
+            if (st.st_mtime_ns, st.st_size) == chunk.stat: return
+
+            # reopening a lazy file is already cheap, and guarantees the dask graph doesn't point at stale file contents
+            if self.refresh_dim is not None and chunk.last is not None and not self.lazy:
+                with xr.open_dataset(path) as raw:
+                    values = raw[self.refresh_dim].values
+                    is_new = values > chunk.last
+                    n_new = int(is_new.sum())
+                    # only an append to the end of the file can be read as a tail
+                    if n_new and is_new[-n_new:].all():
+                        tail = raw.isel({self.refresh_dim: slice(-n_new, None)}).load()
+                        print(f'DataLoader {self.name}._refresh_chunk: appending {n_new} entries from {chunk.fname}')
+                        tail = _sorted(self.file_preproc(tail), self.sortby_dim)
+                        self._set_chunk_data(chunk, xr.concat([chunk.data, tail], dim=self.concat_dim, coords='minimal'))
+                        chunk.stat = (st.st_mtime_ns, st.st_size)
+                        chunk.last = values.max()
+                        self.memory_budget.touch(self, chunk.fname, chunk.nbytes)
+                        return
+
+            print(f'DataLoader {self.name}._refresh_chunk: reloading {chunk.fname}')
+            self._add_chunk(self._load_chunk(chunk.day, chunk.fname))
+        except Exception as e:
+            _print_load_error(chunk.fname, e)
+
+    def _set_chunk_data(self, chunk: DataChunk, data: xr.Dataset) -> None:
+        '''Sets the data of chunk, and rebuilds its pyramid levels.'''
+        levels = build_levels(data, self.sortby_dim, self.pyramid, self.pyramid_aggregates) if self.pyramid else {}
+        chunk.set_data(data, levels)
+        self.version += 1
+
+    def _add_chunk(self, chunk: DataChunk) -> None:
+        '''Stores chunk, inserting it into the ordered index and registering it with the memory budget. The pyramid levels of the chunk are built here, as the chunk may have been loaded in another process.'''
+        if self.pyramid and not chunk.levels:
+            self._set_chunk_data(chunk, chunk.data)
+        if chunk.fname not in self.chunks:
+            bisect.insort(self._index, (chunk.day, chunk.fname))
+        self.chunks[chunk.fname] = chunk
+        self.version += 1
+        nbytes = chunk.nbytes
+        self.memory_budget.touch(self, chunk.fname, nbytes)
+        metrics.inc('sleigh_files_loaded_total', help='Files loaded by each DataLoader.', loader=self.name)
+        metrics.inc('sleigh_bytes_loaded_total', nbytes, help='Bytes of data loaded by each DataLoader (excluding memory-mapped arrays).', loader=self.name)
+
+    def _evict(self, fname: str) -> None:
+        '''Removes the chunk loaded from fname. It will be loaded again the next time it is required. Called by the MemoryBudget.'''
+        with self._lock:
+            chunk = self.chunks.pop(fname, None)
+            if chunk is not None:
+                print(f'DataLoader {self.name}._evict: evicted {fname}')
+                self._index.remove((chunk.day, fname))
+                # cached views may hold the evicted data
+                self._views.clear()
+            # the chunk may have been reloaded since it was chosen for eviction
+            self.memory_budget.discard(self, fname)
+
+    def _select_chunks(self,
+        dtr: tuple[dt.datetime, dt.datetime]
+    ) -> list[DataChunk]:
+        '''Returns the loaded chunks whose day lies within dtr, in index order.'''
+        lo = bisect.bisect_left(self._index, (_as_date(dtr[0]), ''))
+        hi = bisect.bisect_right(self._index, (_as_date(dtr[1]), chr(0x10ffff)))
+        return [self.chunks[f] for _, f in self._index[lo:hi]]
+
+    def _assemble(self, chunks: list[DataChunk], level: str | None = None) -> xr.Dataset | None:
+        '''Combines chunks (given in index order) along concat_dim, using their pyramid level if one is given. The chunks are sorted individually when loaded, so the combined dataset only needs sorting if neighbouring chunks overlap.'''
+        if not chunks: return None
+        datasets = [c.data if level is None else c.levels[level] for c in chunks]
+        if len(datasets) == 1: return datasets[0]
+        with metrics.span('concat'):
+            # coords='minimal' gives the same dataset as the default for every tab's files, without comparing the coordinates that lack concat_dim. Those must be equal across files: one that differs (e.g. a scalar lat that changes from day to day) raises a MergeError rather than being concatenated along concat_dim
+            ds = xr.concat(datasets, dim=self.concat_dim, coords='minimal')
+            return _sorted(ds, self.sortby_dim)
+
     def _get_files_from_dtr(self,
         dtr: tuple[dt.datetime, dt.datetime]
-    ) -> list[str]:
-        '''Returns a list of filenames using the fname_fmt that are utilised within dtr.'''
-        # TODO: implement hourly loading? for gfs... 
-        start = dtr[0]
-        end = dt.datetime.combine(dtr[1], dt.datetime.min.time())
-        dt0 = dt.datetime(year=start.year, month=start.month, day=start.day)
-        one_day = dt.timedelta(days=1)
-
-        flist = []
-        while dt0 < end:
-            flist.append( dt0.strftime(self.fname_fmt) )
-            dt0 += one_day
-        return flist
+    ) -> list[tuple[dt.date, str]]:
+        '''Returns a list of the (day, filename) pairs of the files in dir that are utilised within dtr.'''
+        with metrics.span('file_discovery'):
+            return self.dir_index.files_between(_as_date(dtr[0]), _as_date(dtr[1]))
+
+
+def _read_file(
+    path: str,
+    file_preproc: callable,
+    sortby_dim: str,
+    refresh_dim: str | None,
+    lazy: bool = False,
+    dask_chunks: dict | str = {},
+    store: ChunkStore | None = None,
+    store_name: str | None = None
+) -> tuple[xr.Dataset, tuple[int, int], object]:
+    '''Reads and preprocesses the file at path, returning the dataset, the (mtime, size) of the file and the last value along refresh_dim. If a ChunkStore is given, the preprocessed dataset is read from (or written to) it. This is a module-level function so that it can be run in a process pool.'''
+    st = os.stat(path)
+    fname = os.path.basename(path)
+    # lazy datasets are cheap to open, and would be read in full to be cached
+    use_store = store is not None and not lazy
+    if use_store:
+        key = store.key(path, st, file_preproc, sortby_dim)
+        with metrics.span('chunk_store_read', file=fname):
+            cached = store.get(store_name, fname, key)
+        metrics.cache_request('chunk_store', cached is not None, loader=store_name)
+        if cached is not None:
+            return cached[0], (st.st_mtime_ns, st.st_size), cached[1]
+
+    if not (use_store and store.is_settled(st)):
+        return _read_raw(path, file_preproc, sortby_dim, refresh_dim, lazy, dask_chunks, st)
+
+    # another process sharing the store may already be reading this file, in which case its entry is used once it's written
+    with store.lock(store_name, fname):
+        cached = store.get(store_name, fname, key)
+        if cached is not None:
+            return cached[0], (st.st_mtime_ns, st.st_size), cached[1]
+        ds, stat, last = _read_raw(path, file_preproc, sortby_dim, refresh_dim, lazy, dask_chunks, st)
+        try:
+            store.put(store_name, fname, key, ds, last)
+        except Exception as e:
+            print(f'DataLoader._read_file: failed to cache {fname}: {e}')
+            return ds, stat, last
+    # read the entry back, so that a memory-mapped store serves the shared arrays rather than this process's copy
+    cached = store.get(store_name, fname, key) if store.mmap else None
+    if cached is not None:
+        return cached[0], stat, cached[1]
+    return ds, stat, last
+
+def _read_raw(
+    path: str,
+    file_preproc: callable,
+    sortby_dim: str,
+    refresh_dim: str | None,
+    lazy: bool,
+    dask_chunks: dict | str,
+    st: os.stat_result
+) -> tuple[xr.Dataset, tuple[int, int], object]:
+    '''Reads and preprocesses the file at path, without using a ChunkStore.'''
+    fname = os.path.basename(path)
+    with metrics.span('file_read', file=fname):
+        if lazy:
+            raw = xr.open_dataset(path, chunks=dask_chunks)
+        else:
+            raw = xr.load_dataset(path)
+    last = None
+    if refresh_dim is not None and raw.sizes.get(refresh_dim, 0) > 0:
+        last = raw[refresh_dim].values.max()
+    with metrics.span('file_preproc', file=fname):
+        ds = _sorted(file_preproc(raw), sortby_dim)
+    return ds, (st.st_mtime_ns, st.st_size), last
+
+def _sorted(ds: xr.Dataset, dim: str) -> xr.Dataset:
+    '''Sorts ds along dim, if it isn't already sorted (sorting lazy data adds an indexing step to every later read).'''
+    index = ds.indexes.get(dim)
+    if index is not None and index.is_monotonic_increasing: return ds
+    return ds.sortby(dim)
+
+# worker pools for concurrent file loading, shared between DataLoaders and keyed by (kind, max_workers)
+_pools = {}
+_pools_lock = threading.Lock()
+
+def _get_pool(kind: str, max_workers: int):
+    with _pools_lock:
+        if (kind, max_workers) not in _pools:
+            if kind == 'process':
+                # the server runs several threads, so worker processes are spawned rather than forked
+                pool = ProcessPoolExecutor(max_workers, mp_context=multiprocessing.get_context('spawn'))
+            else:
+                pool = ThreadPoolExecutor(max_workers, thread_name_prefix='DataLoader')
+            _pools[(kind, max_workers)] = pool
+        return _pools[(kind, max_workers)]
+
+def _print_load_error(fname: str, e: Exception) -> None:
+    print('!!! ' + '='*44 + ' !!!')
+    print(f'DATALOADER ERROR: failed to load {fname}')
+    print(e)
+    print('!!! ' + '-'*44 + ' !!!')
+
+def _as_date(t: dt.date | dt.datetime) -> dt.date:
+    if isinstance(t, dt.datetime): return t.date()
+    return t
@@ -0,0 +1,77 @@
+'''Author: Andrew Martin
+Creation Date: 18/10/26
+
+Script containing the DataLoaderRegistry class, a process-wide collection of DataLoader objects that is shared by every session served by the dashboard. Sessions are given lightweight DataLoaderHandle objects rather than their own DataLoader, so that each data file is only read (and held in memory) once per server process.
+'''
+
+import threading
+
+from .DataLoader import DataLoader
+
+
+class DataLoaderHandle:
+    '''DataLoaderHandle is a session-level reference to a DataLoader held within the DataLoaderRegistry. It behaves like the DataLoader it refers to (it can be called with a datetime range, and attribute access is forwarded), but holds no data of its own.
+
+    ATTRIBUTES:
+        loader: DataLoader
+    '''
+    __slots__ = ('loader',)
+
+    def __init__(self, loader: DataLoader):
+        self.loader = loader
+
+    def __call__(self, dtr, augment=False):
+        return self.loader(dtr, augment)
+
+    async def fetch(self, dtr, augment=False):
+        return await self.loader.fetch(dtr, augment)
+
+    def __getattr__(self, attr):
+        return getattr(self.loader, attr)
+
+    def __repr__(self):
+        return f'DataLoaderHandle({self.loader.name})'
+
+
+class DataLoaderRegistry:
+    '''DataLoaderRegistry is a thread-safe store of DataLoader objects, keyed by name. A DataLoader is created from its factory function the first time it is requested, and every later request for the same key returns a handle to that same object.
+
+    ATTRIBUTES:
+        loaders: dict[str: DataLoader]
+
+    METHODS:
+        get
+        clear
+    '''
+
+    def __init__(self):
+        self.loaders = {}
+        self._lock = threading.Lock()
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.loaders
+
+    def get(self, key: str, factory: callable) -> DataLoaderHandle:
+        '''Returns a handle to the DataLoader registered under key, creating it by calling factory() if it does not exist yet.
+
+        INPUTS:
+            key: str
+                name under which the DataLoader is registered
+
+            factory: callable -> DataLoader
+                function that creates the DataLoader, only called if key is not yet registered
+        '''
+        with self._lock:
+            if key not in self.loaders:
+                print(f'DataLoaderRegistry.get: creating shared DataLoader {key}')
+                self.loaders[key] = factory()
+            return DataLoaderHandle(self.loaders[key])
+
+    def clear(self) -> None:
+        '''Removes all registered DataLoader objects. Handles that are already held by sessions keep their reference to the old DataLoader.'''
+        with self._lock:
+            self.loaders = {}
+
+
+# the process-wide registry used by the dashboard
+registry = DataLoaderRegistry()
@@ -0,0 +1,110 @@
+'''Author: Andrew Martin
+Creation Date: 18/10/26
+
+Script for the DirectoryIndex class, which keeps a parsed, sorted index of the files in a data directory that match a DataLoader filename format. The directory is only re-listed when its modification time changes, so finding the files for a datetime range is a sorted lookup rather than an os.listdir call.
+'''
+
+import datetime as dt
+import os
+import re
+import threading
+import bisect
+import time
+
+# regular expressions for the strftime directives that may appear in a filename format
+_directives = {
+    '%Y': r'(?P<Y>\d{4})',
+    '%y': r'(?P<y>\d{2})',
+    '%m': r'(?P<m>\d{2})',
+    '%d': r'(?P<d>\d{2})',
+    '%j': r'(?P<j>\d{3})',
+    '%H': r'\d{2}',
+    '%M': r'\d{2}',
+    '%S': r'\d{2}',
+    '%%': '%',
+}
+
+
+def fname_fmt_to_regex(fname_fmt: str) -> re.Pattern:
+    '''Converts a filename format (strftime directives, with optional glob-like * and ? wildcards) into a compiled regular expression that captures the date of a matching filename.'''
+    pattern = ''
+    i = 0
+    while i < len(fname_fmt):
+        if fname_fmt[i:i+2] in _directives:
+            token = fname_fmt[i:i+2]
+            # a directive may appear more than once, but a named group can't
+            if token[1] in 'Yymdj' and f'(?P<{token[1]}>' in pattern:
+                pattern += rf'(?P={token[1]})'
+            else:
+                pattern += _directives[token]
+            i += 2
+            continue
+        c = fname_fmt[i]
+        if c == '*': pattern += '.*'
+        elif c == '?': pattern += '.'
+        else: pattern += re.escape(c)
+        i += 1
+    return re.compile(pattern + '$')
+
+
+class DirectoryIndex:
+    '''DirectoryIndex is a sorted index of (day, filename) for the files in a directory that match a filename format.
+
+    The directory is rescanned when its modification time changes (i.e. when files are added, removed or renamed), and at least every max_age seconds in case a change is missed by the filesystem's timestamp resolution.
+
+    ATTRIBUTES:
+        dir: str
+        fname_fmt: str
+        entries: list[tuple[dt.date, str]]
+
+    METHODS:
+        files_between
+        refresh
+    '''
+
+    def __init__(self, dir: str, fname_fmt: str, max_age: float = 60):
+        self.dir = dir
+        self.fname_fmt = fname_fmt
+        self.max_age = max_age
+        self.regex = fname_fmt_to_regex(fname_fmt)
+        self.entries = []
+        self._mtime = None
+        self._scan_time = 0
+        self._lock = threading.Lock()
+
+    def refresh(self) -> None:
+        '''Rescans the directory if it has changed since the last scan.'''
+        with self._lock:
+            try:
+                mtime = os.stat(self.dir).st_mtime_ns
+            except OSError:
+                self.entries, self._mtime = [], None
+                return
+            if mtime == self._mtime and time.monotonic() - self._scan_time < self.max_age:
+                return
+            self._scan_time = time.monotonic()
+            self._mtime = mtime
+            self.entries = sorted(
+                entry for entry in map(self._parse, os.listdir(self.dir))
+                if entry is not None
+            )
+
+    def files_between(self, start: dt.date, end: dt.date) -> list[tuple[dt.date, str]]:
+        '''Returns the (day, filename) entries with start <= day < end.'''
+        self.refresh()
+        entries = self.entries
+        lo = bisect.bisect_left(entries, (start, ''))
+        hi = bisect.bisect_left(entries, (end, ''))
+        return entries[lo:hi]
+
+    def _parse(self, fname: str) -> tuple[dt.date, str] | None:
+        match = self.regex.match(fname)
+        if match is None: return None
+        groups = match.groupdict()
+        try:
+            year = int(groups['Y']) if groups.get('Y') else 2000 + int(groups['y'])
+            if groups.get('j') is not None:
+                return (dt.date(year, 1, 1) + dt.timedelta(days=int(groups['j'])-1), fname)
+            return (dt.date(year, int(groups['m']), int(groups['d'])), fname)
+        except (KeyError, TypeError, ValueError):
+            return None
@@ -0,0 +1,285 @@
+'''Author: Andrew Martin
+Creation Date: 18/10/26
+
+Script for the process-wide metrics of the dashboard. The work done to serve a plot is timed in spans: finding, reading and preprocessing files, combining and slicing the loaded data, postprocessing, plotting, and serialising the plots for Bokeh. Spans are tagged with the DataLoader, tab and session they were run for, using the tags context manager, whose tags are inherited by every span within it. Alongside the spans, counters record e.g. cache hits and misses and the bytes loaded by each DataLoader.
+
+Span durations are aggregated into histograms labelled by span name, DataLoader and tab (sessions are short-lived, so they aren't used as labels), and the most recent spans are kept with all of their tags. Both are served by the dashboard next to the panel apps (see dashboard.py): the metrics in the Prometheus text format at /metrics, and the recent spans as JSON at /metrics/spans. With several server processes, each serves its own metrics.
+'''
+
+import contextvars
+import json
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import tornado.web
+
+# upper bounds (in seconds) of the span duration histogram buckets
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# tags of a span that are used as labels of the aggregated span histogram
+AGGREGATED_TAGS = ('loader', 'tab')
+# name of the histogram of span durations
+SPAN_METRIC = 'sleigh_span_seconds'
+# major versions of Bokeh whose serialisation instrument_bokeh can time
+BOKEH_VERSIONS = ('3',)
+
+# tags applied to the spans started within the current context (thread or asyncio task)
+_tags = contextvars.ContextVar('sleigh_metrics_tags', default={})
+# names of the spans open in the current context, outermost first
+_span_path = contextvars.ContextVar('sleigh_metrics_span_path', default=())
+
+
+@contextmanager
+def tags(**labels):
+    '''Context manager that tags every span started within it (including in nested contexts) with labels, e.g. tags(tab='ASFS', session=...). Tags with a value of None are ignored.'''
+    token = _tags.set({**_tags.get(), **{k: str(v) for k, v in labels.items() if v is not None}})
+    try:
+        yield
+    finally:
+        _tags.reset(token)
+
+def current_tags() -> dict[str: str]:
+    return dict(_tags.get())
+
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items() if v is not None))
+
+def _format_labels(key: tuple, extra: tuple = ()) -> str:
+    pairs = [*key, *extra]
+    if not pairs: return ''
+    escape = lambda v: v.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{k}="{escape(v)}"' for k, v in pairs) + '}'
+
+
+class Metrics:
+    '''Metrics is a thread-safe store of counters, gauges and histograms, each identified by a name and a set of labels, and of the most recent spans.
+
+    ATTRIBUTES:
+        buckets: tuple[float]
+        recent_spans: deque[dict]
+
+    METHODS:
+        inc
+        cache_request
+        set_gauge
+        observe
+        span
+        active_spans
+        add_collector
+        spans
+        render_prometheus
+        clear
+    '''
+
+    def __init__(self, buckets: tuple[float] = DEFAULT_BUCKETS, max_spans: int = 2000):
+        self.buckets = tuple(buckets)
+        self.recent_spans = deque(maxlen=max_spans)
+        # name -> (type, help)
+        self._meta = {}
+        # name -> {label key: value}, where histogram values are [bucket counts, sum, count]
+        self._values = {}
+        # functions that set gauges when the metrics are rendered
+        self._collectors = []
+        # id -> (frame that opened the span, span) of every open span (read by the Profiler)
+        self._active = {}
+        self._lock = threading.Lock()
+
+    def _series(self, name: str, kind: str, help: str) -> dict:
+        if name not in self._meta:
+            self._meta[name] = (kind, help)
+            self._values[name] = {}
+        return self._values[name]
+
+    def inc(self, name: str, value: float = 1, help: str = '', **labels) -> None:
+        '''Increments the counter name (with the given labels) by value.'''
+        key = _label_key(labels)
+        with self._lock:
+            series = self._series(name, 'counter', help)
+            series[key] = series.get(key, 0) + value
+
+    def cache_request(self, cache: str, hit: bool, **labels) -> None:
+        '''Counts a hit or miss of cache.'''
+        self.inc('sleigh_cache_requests_total', help='Requests to the caches of the dashboard, by cache and result.', cache=cache, result='hit' if hit else 'miss', **labels)
+
+    def set_gauge(self, name: str, value: float, help: str = '', **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            self._series(name, 'gauge', help)[key] = value
+
+    def observe(self, name: str, value: float, help: str = '', **labels) -> None:
+        '''Records value in the histogram name (with the given labels).'''
+        key = _label_key(labels)
+        with self._lock:
+            series = self._series(name, 'histogram', help)
+            hist = series.get(key)
+            if hist is None:
+                hist = series[key] = [[0]*len(self.buckets), 0., 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    hist[0][i] += 1
+                    break
+            hist[1] += value
+            hist[2] += 1
+
+    @contextmanager
+    def span(self, name: str, **labels):
+        '''Context manager timing the work within it as a span called name, tagged with labels and the tags of the current context.'''
+        span_tags = {**_tags.get(), **{k: str(v) for k, v in labels.items() if v is not None}}
+        path = _span_path.get() + (name,)
+        token = _span_path.set(path)
+        active = {'span': name, 'path': path, **span_tags}
+        # the frame of the with statement (beneath the contextmanager's __enter__), which is only on a thread's stack while the work within the span runs in it, so the spans of coroutines waiting on the event loop aren't attributed to the loop's thread
+        with self._lock:
+            self._active[id(active)] = (sys._getframe(2), active)
+        start = time.time()
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - t0
+            with self._lock:
+                del self._active[id(active)]
+            _span_path.reset(token)
+            self.observe(SPAN_METRIC, duration, 'Duration of the spans of work done to serve the dashboard.', span=name, **{k: span_tags.get(k) for k in AGGREGATED_TAGS})
+            self.recent_spans.append({'span': name, 'start': start, 'duration': duration, **span_tags})
+
+    def active_spans(self, frame) -> list[dict]:
+        '''Returns the spans (name, path of the enclosing spans' names, including those opened in the context it was copied from, and tags) open in the stack of frame (e.g. a thread's current frame), outermost first. The spans of suspended coroutines aren't in any thread's stack.'''
+        stack = set()
+        while frame is not None:
+            stack.add(id(frame))
+            frame = frame.f_back
+        with self._lock:
+            spans = [active for opener, active in self._active.values() if id(opener) in stack]
+        return sorted(spans, key=lambda s: len(s['path']))
+
+    def add_collector(self, func: callable) -> None:
+        '''Adds a function, called with this Metrics object whenever the metrics are rendered, which sets gauges of the current state (e.g. memory use).'''
+        self._collectors.append(func)
+
+    def spans(self) -> list[dict]:
+        '''Returns the most recent spans, oldest first.'''
+        return list(self.recent_spans)
+
+    def render_prometheus(self) -> str:
+        '''Returns the metrics in the Prometheus text exposition format.'''
+        for func in self._collectors:
+            try:
+                func(self)
+            except Exception as e:
+                print(f'Metrics.render_prometheus: collector {func} failed: {e}')
+
+        lines = []
+        with self._lock:
+            for name, (kind, help) in sorted(self._meta.items()):
+                if help: lines.append(f'# HELP {name} {help}')
+                lines.append(f'# TYPE {name} {kind}')
+                for key, value in sorted(self._values[name].items()):
+                    if kind != 'histogram':
+                        lines.append(f'{name}{_format_labels(key)} {value}')
+                        continue
+                    counts, total, count = value
+                    cumulative = 0
+                    for bound, n in zip(self.buckets, counts):
+                        cumulative += n
+                        lines.append(f'{name}_bucket{_format_labels(key, (("le", f"{bound:g}"),))} {cumulative}')
+                    lines.append(f'{name}_bucket{_format_labels(key, (("le", "+Inf"),))} {count}')
+                    lines.append(f'{name}_sum{_format_labels(key)} {total}')
+                    lines.append(f'{name}_count{_format_labels(key)} {count}')
+        return '\n'.join(lines) + '\n'
+
+    def clear(self) -> None:
+        with self._lock:
+            self._meta.clear()
+            self._values.clear()
+            self.recent_spans.clear()
+
+
+# the metrics of the process, shared by every session
+metrics = Metrics()
+
+
+class MetricsHandler(tornado.web.RequestHandler):
+    '''Serves the process's metrics in the Prometheus text format.'''
+
+    def get(self):
+        self.set_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.write(metrics.render_prometheus())
+
+
+class SpansHandler(tornado.web.RequestHandler):
+    '''Serves the most recent spans as a JSON list, oldest first. The number of spans is limited by the limit argument (default 500), and they can be filtered by any tag, e.g. /metrics/spans?tab=ASFS&session=...'''
+
+    def get(self):
+        limit = int(self.get_argument('limit', '500'))
+        filters = {k: self.get_argument(k) for k in self.request.arguments if k != 'limit'}
+        spans = [s for s in metrics.spans() if all(s.get(k) == v for k, v in filters.items())]
+        self.set_header('Content-Type', 'application/json')
+        self.write(json.dumps(spans[-limit:]))
+
+
+# routes to add to the server with pn.serve(..., extra_patterns=metrics_patterns)
+metrics_patterns = [
+    (r'/metrics', MetricsHandler),
+    (r'/metrics/spans', SpansHandler),
+]
+
+
+def session_id(doc=None) -> str | None:
+    '''Returns the id of the session of the Bokeh document doc (default the current document), or None outside of a session.'''
+    if doc is None:
+        try:
+            from bokeh.io import curdoc
+            doc = curdoc()
+        except Exception:
+            return None
+    context = getattr(doc, 'session_context', None)
+    return getattr(context, 'id', None)
+
+
+# the original attributes replaced by instrument_bokeh, {(owner, attribute): value}
+_bokeh_originals = {}
+
+def instrument_bokeh() -> bool:
+    '''Times the serialisation of Bokeh documents (when a session is created) and of the updates sent to sessions, as bokeh_serialize spans tagged with the session. Returns whether Bokeh is instrumented.
+
+    Bokeh has no hook for this, so Document.to_json and patch_doc.create are wrapped in place. They are only wrapped for the major versions in BOKEH_VERSIONS, which have the attributes (and signatures) the wrappers were written for, and are restored by uninstrument_bokeh, or if wrapping them fails.'''
+    if _bokeh_originals: return True
+
+    import bokeh
+    from bokeh.document import Document
+    from bokeh.protocol.messages.patch_doc import patch_doc
+
+    to_json = vars(Document).get('to_json')
+    create = vars(patch_doc).get('create')
+    if bokeh.__version__.split('.')[0] not in BOKEH_VERSIONS or not callable(to_json) or not isinstance(create, classmethod):
+        print(f'instrument_bokeh: Bokeh {bokeh.__version__} is not supported, its serialisation is not timed')
+        return False
+
+    def timed_to_json(self, *args, **kwargs):
+        with metrics.span('bokeh_serialize', session=session_id(self), kind='document'):
+            return to_json(self, *args, **kwargs)
+
+    def timed_create(cls, events, *args, **kwargs):
+        doc = getattr(events[0], 'document', None) if events else None
+        with metrics.span('bokeh_serialize', session=session_id(doc) if doc is not None else None, kind='patch'):
+            return create.__func__(cls, events, *args, **kwargs)
+
+    _bokeh_originals.update({(Document, 'to_json'): to_json, (patch_doc, 'create'): create})
+    try:
+        Document.to_json = timed_to_json
+        patch_doc.create = classmethod(timed_create)
+    except Exception as e:
+        print(f'instrument_bokeh: unable to instrument Bokeh: {type(e).__name__}: {e}')
+        uninstrument_bokeh()
+        return False
+    return True
+
+def uninstrument_bokeh() -> None:
+    '''Restores the Bokeh attributes wrapped by instrument_bokeh.'''
+    for (owner, attr), value in _bokeh_originals.items():
+        setattr(owner, attr, value)
+    _bokeh_originals.clear()
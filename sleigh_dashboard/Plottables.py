@@ -3,14 +3,31 @@ Creation Date: 15/4/24
 
 Script containing the class for the BasePlottable, and the inheriting Plottable objects that describe scatter, line, 2D plots, etc.
 '''
+import asyncio
+import contextvars
+import inspect
 import xarray as xr
 import holoviews as hv
 import hvplot.xarray
 import panel as pn
 
+from .Downsample import m4_downsample
+from .RenderCache import render_cache, plottable_identity
+from .Metrics import metrics, tags
+
+try:
+    import datashader
+except ImportError:
+    datashader = None
+
 # callable [ dict [str: xr.Dataset] ] 
 postproc_identity = lambda dd: dd
 
+
+def _is_static(hvo) -> bool:
+    '''Whether hvo is a holoviews object without any DynamicMaps, which can be shown in several sessions at once.'''
+    return isinstance(hvo, hv.core.Dimensioned) and not hvo.traverse(lambda x: x, [hv.DynamicMap])
+
 class BasePlottable:
     '''Base plottable class'''
 
@@ -28,10 +45,13 @@ class BasePlottable:
         self.dd = None
         self.plotfuncs = [self.plot]
         self.postproc = postproc
+        # if True, the plotted Curve and Scatter elements are downsampled to the width of the plot (see Downsample.py)
+        self.downsample = False
 
 
     def __panel__(self):
-        panelob = pn.bind(self._plot, self.dd)
+        # _plot is a coroutine that waits for the data, so a loading indicator is shown until it returns
+        panelob = pn.panel(pn.bind(self._plot, self.dd), loading_indicator=True)
         #panelob = pn.bind(self.plot, self.dd)
         if type(panelob) is AttributeError:
             panelob = pn.pane.Markdown(f'## Attribute error, {panelob}')
@@ -53,38 +73,105 @@ class BasePlottable:
         return new_plottable
         
 
-    def _plot(self,dd):
-        '''This is the wrapper function for calling plotting functions that return holoviews objects. This will handle type exceptions'''
-        plot_outputs = [f(dd) for f in self.plotfuncs]
-        hv_outputs = []
+    async def _plot(self,dd):
+        '''This is the wrapper function for calling plotting functions that return holoviews objects. This will handle type exceptions. dd may be awaitable (see Tab._bind_data), in which case the data is awaited first. The plotting itself runs in the event loop's default executor (see _plot_data), so other sessions are served meanwhile.
+
+        If dd is a Tab.DataBundle, the combined holoviews object is stored in the process-wide render_cache, so sessions plotting the same data share it rather than each re-plotting it. Dynamic operations (e.g. downsampling) depend on the session's plot, so they are applied after the cache.'''
+        if inspect.isawaitable(dd):
+            dd = await dd
+        # plotting (postproc, derived variables, hvplot, downsampling) is CPU-bound, so it is run in an executor rather than blocking the event loop, in a copy of the context so that its metrics spans are tagged and nested as they would be here
+        with tags(**getattr(dd, 'tags', {})):
+            ctx = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(None, ctx.run, self._plot_data, dd)
+
+    def _plot_data(self, dd):
+        '''Returns the panel object plotting dd, from the render_cache if possible (see _plot).'''
+        key = versions = hvo = None
+        if getattr(dd, 'cache_key', None) is not None:
+            key = (self._get_cache_identity(), *dd.cache_key)
+            versions = tuple(sorted(dd.versions.items()))
+            hvo = render_cache.get(key, versions)
+            metrics.cache_request('render', hvo is not None, tab=dd.tags.get('tab'))
+
         erroneous_outputs = []
+        if hvo is None:
+            with metrics.span('render'):
+                hvo, errors = self._render(dd)
+            erroneous_outputs = [pn.pane.Markdown(f'## Exception: {e}') for e in errors]
+            # plots that failed, or contain panel objects or DynamicMaps, can't be shared between sessions
+            if key is not None and not errors and _is_static(hvo):
+                render_cache.put(key, versions, hvo)
+        
+        if hvo is None:
+            return pn.Column(*erroneous_outputs)
+        if any(getattr(p, 'downsample', False) for p in self._plotfunc_owners()):
+            hvo = m4_downsample(hvo)
+        return pn.Column(
+            hvo, *erroneous_outputs
+        )
+
+    def _render(self, dd) -> tuple[object, list[Exception]]:
+        '''Calls the plotting functions and combines their holoviews outputs into a single overlay. Returns the overlay (or None if every plotting function failed) and the exceptions returned by the plotting functions.'''
+        plot_outputs = []
+        for f, owner in zip(self.plotfuncs, self._plotfunc_owners()):
+            with metrics.span('plot', plottable=owner._label()):
+                # a Tab.DataBundle only adds the derived variables the plot refers to
+                plot_outputs.append(f(dd.select(owner._variables()) if hasattr(dd, 'select') else dd))
+        hv_outputs = []
+        errors = []
         
         for po in plot_outputs:
             if isinstance(po, Exception):
-                erroneous_outputs.append(
-                    pn.pane.Markdown(f'## Exception: {po}')
-                )
+                errors.append(po)
             else:
                 hv_outputs.append(po)
 
-        if hv_outputs:
-            #TODO: fix the multi_y for multiplied plots, currently its fucked...
-            try:
-                hvo = hv.Overlay(hv_outputs).opts(active_tools=['box_zoom'])
-            except:
-                hvo = hv_outputs[0]
-            ylim_set = False
-            #for hvp in hvo:
-                #print(hvp.opts.info())
-                #if 'ylim' in hvp.opts.info():
-                #    ylim_set = True
-            #    break
-            if ylim_set: hvo.opts(multi_y=True)
-            return pn.Column(
-                hvo, *erroneous_outputs
-            )
-        else:
-            return pn.Column(*erroneous_outputs)
+        if not hv_outputs:
+            return None, errors
+
+        #TODO: fix the multi_y for multiplied plots, currently its fucked...
+        try:
+            hvo = hv.Overlay(hv_outputs).opts(active_tools=['box_zoom'])
+        except:
+            hvo = hv_outputs[0]
+        ylim_set = False
+        #for hvp in hvo:
+            #print(hvp.opts.info())
+            #if 'ylim' in hvp.opts.info():
+            #    ylim_set = True
+        #    break
+        if ylim_set: hvo.opts(multi_y=True)
+        return hvo, errors
+
+    def _get_cache_identity(self) -> tuple:
+        '''Returns the identity of the plottable used in render_cache keys. It is computed on first use, after the inheriting classes have finished setting the plotargs.'''
+        if getattr(self, '_cache_identity', None) is None:
+            self._cache_identity = plottable_identity(self)
+        return self._cache_identity
+
+    def _label(self) -> str:
+        '''Returns a short description of the plottable, used to tag its metrics spans.'''
+        return f'{type(self).__name__}:{self.datasource}.{self.variable}'
+
+    def _variables(self) -> list[str]:
+        '''Returns the names of the variables the plottable refers to (its variable and any string plotargs, e.g. by), so that only the derived variables among them are calculated for it (see Tab.DataBundle).'''
+        variables = [self.variable] if isinstance(self.variable, str) else list(self.variable or [])
+        return [*variables, *(v for v in self.plotargs.values() if isinstance(v, str))]
+
+    def _postproc(self, dd):
+        '''Applies the postproc to dd, timed as a metrics span.'''
+        with metrics.span('postproc'):
+            return self.postproc(dd)
+
+    def _hvplot(self, ds, kind: str | None = None, **kwargs):
+        '''Plots ds with hvplot (of the given kind, or the default), timed as a metrics span.'''
+        with metrics.span('hvplot'):
+            plotter = ds.hvplot if kind is None else getattr(ds.hvplot, kind)
+            return plotter(**kwargs)
+
+    def _plotfunc_owners(self) -> list:
+        '''Returns the plottables whose plot functions make up this (possibly multiplied) plottable.'''
+        return [getattr(f, '__self__', self) for f in self.plotfuncs]
 
     def plot(self,dd):
         '''Function that needs to be called to return the panel object, is bound in __panel__'''
@@ -92,8 +179,10 @@ class BasePlottable:
 
 
 class Plot_2D(BasePlottable):
-    '''Plottable class for the 2D plots.'''
-    def __init__(self, datasource, variable, plotargs, height=400, cmap='viridis', cnorm='linear', clim=(None, None)):
+    '''Plottable class for the 2D plots.
+
+    If rasterize is True, the data is aggregated server-side by datashader into an image the size of the plot, which is re-aggregated whenever the user zooms or pans. The data is plotted as a QuadMesh so that irregular timestamps are binned correctly, and cmap, cnorm and clim are applied to the aggregated image.'''
+    def __init__(self, datasource, variable, plotargs, height=400, cmap='viridis', cnorm='linear', clim=(None, None), rasterize=False):
         
         super().__init__(datasource, variable, plotargs)
         self.plotargs['height'] = height
@@ -101,24 +190,30 @@ class Plot_2D(BasePlottable):
         self.plotargs['cmap']=cmap
         self.plotargs['cnorm']=cnorm
         self.plotargs['clim']=clim
+
+        if rasterize and datashader is None:
+            print(f'Plot_2D {datasource}.{variable}: datashader is not installed, plotting without rasterization')
+            rasterize = False
+        self.rasterize = rasterize
+        if self.rasterize:
+            self.plotargs['rasterize'] = True
+            self.plotargs.setdefault('kind', 'quadmesh')
         
     def plot(self, dd):
         try:
-            dd = self.postproc(dd)
-            return dd[self.datasource][self.variable].hvplot(
-                **self.plotargs
-            )
+            dd = self._postproc(dd)
+            return self._hvplot(dd[self.datasource][self.variable], **self.plotargs)
         except Exception as e:
             return e
     
 
 class Plot_scatter(BasePlottable):
     '''Plottable class for the scatter plots.'''
-    def __init__(self, datasource, variable, plotargs, height=300, s=5, marker='+', postproc=postproc_identity):
+    def __init__(self, datasource, variable, plotargs, height=300, s=5, marker='+', postproc=postproc_identity, downsample=False):
         
         super().__init__(datasource, variable, plotargs, postproc=postproc)
 
-        
+        self.downsample = downsample
         self.plotargs['height'] = height
         self.plotargs['s'] = 5
         self.plotargs['marker'] = marker
@@ -128,30 +223,27 @@ class Plot_scatter(BasePlottable):
 
     def plot(self, dd):
         try:
-            dd = self.postproc(dd)
-            return dd[self.datasource][self.variable].hvplot.scatter(
-                **self.plotargs
-            )
+            dd = self._postproc(dd)
+            return self._hvplot(dd[self.datasource][self.variable], 'scatter', **self.plotargs)
         except Exception as e:
             return e
 
 
 class Plot_line(BasePlottable):
     '''Plottable class for line plots.'''
-    def __init__(self, datasource, variable, plotargs, height=300, lw=5, postproc=postproc_identity):
+    def __init__(self, datasource, variable, plotargs, height=300, lw=5, postproc=postproc_identity, downsample=False):
         
         super().__init__(datasource, variable, plotargs, postproc=postproc)
         
+        self.downsample = downsample
         self.plotargs['height'] = height
         self.plotargs['line_width'] = lw
         self.plotargs['grid']=True
 
     def plot(self, dd):
         try:
-            dd = self.postproc(dd)
-            return dd[self.datasource][self.variable].hvplot.line(
-                **self.plotargs
-            )
+            dd = self._postproc(dd)
+            return self._hvplot(dd[self.datasource][self.variable], 'line', **self.plotargs)
         except Exception as e:
             return e
         
@@ -165,9 +257,11 @@ class Plot_line_scatter(BasePlottable):
         lw=2,
         s=50,
         marker='+',
-        postproc: callable = postproc_identity
+        postproc: callable = postproc_identity,
+        downsample: bool = False
     ):
         super().__init__(datasource, variable, plotargs, postproc)
+        self.downsample = downsample
         self.plotargs['height'] = height
         self.lw = lw
         self.s = s
@@ -176,9 +270,9 @@ class Plot_line_scatter(BasePlottable):
 
     def plot(self, dd):
         try:
-            dd = self.postproc(dd)
-            line = dd[self.datasource][self.variable].hvplot.line(**self.plotargs, line_width=self.lw)
-            points = dd[self.datasource][self.variable].hvplot.scatter(**self.plotargs, s=self.s, marker=self.marker)
+            dd = self._postproc(dd)
+            line = self._hvplot(dd[self.datasource][self.variable], 'line', **self.plotargs, line_width=self.lw)
+            points = self._hvplot(dd[self.datasource][self.variable], 'scatter', **self.plotargs, s=self.s, marker=self.marker)
             return line*points
         
         except Exception as e:
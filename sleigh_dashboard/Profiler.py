@@ -0,0 +1,258 @@
+'''Author: Andrew Martin
+Creation Date: 18/10/26
+
+Script for profiling the live dashboard on demand. A SamplingProfiler samples the Python stack of every thread of the server process at a fixed interval, for a number of seconds, either server-wide or restricted to the work done for a single session. The work a thread is doing for a session is identified by the spans open in it (see Metrics.py), so only work within a span tagged with the session is attributed to it.
+
+The samples are written to a local directory as folded stacks (one 'frame;frame;...;frame count' line per distinct stack), which can be turned into a flamegraph by flamegraph.pl or opened in speedscope. Alongside them, a summary breaks the wall-clock time down into the main components of serving a plot (see COMPONENTS), including the time spent waiting within them (e.g. for files loaded by a thread pool, whose spans carry the path of the spans they were submitted from).
+
+Profiles are started through the admin-only /profile route, served by the dashboard next to the panel apps (see dashboard.py), which requires the token set in the SLEIGH_DASHBOARD_ADMIN_TOKEN environment variable, e.g.
+    curl 'http://localhost:5006/profile?seconds=30&token=<token>'
+    curl 'http://localhost:5006/profile?seconds=30&session=<session id, from /metrics/spans>&token=<token>'
+
+Work done by DataLoaders that read files in a process pool happens in the worker processes, so isn't sampled.
+'''
+
+import asyncio
+import datetime as dt
+import hmac
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+import tornado.web
+
+from .Metrics import metrics
+
+# component of the breakdown: (kind, name), where a sample is counted towards a component if one of its frames is the function name (given as 'file.py:qualified name'), or if it was taken within an open span called name
+COMPONENTS = {
+    # the update_data span is opened by both DataLoader.update_data and DataLoader.versioned_data, through which sessions load their data
+    'update_data': ('span', 'update_data'),
+    'file_preproc': ('span', 'file_preproc'),
+    'BasePlottable._plot_data': ('frame', 'Plottables.py:BasePlottable._plot_data'),
+    'Tab._data_column': ('frame', 'Tab.py:Tab._data_column'),
+    'bokeh_serialize': ('span', 'bokeh_serialize'),
+}
+
+# leaf frames of threads waiting for work (e.g. the event loop polling for events), which aren't sampled unless include_idle=True
+IDLE_FRAMES = {
+    'selectors.py:EpollSelector.select',
+    'selectors.py:PollSelector.select',
+    'selectors.py:KqueueSelector.select',
+    'selectors.py:SelectSelector.select',
+    'threading.py:Condition.wait',
+    'threading.py:Thread._wait_for_tstate_lock',
+    'queue.py:Queue.get',
+    'thread.py:_worker',
+}
+
+# environment variable holding the token required to profile. If it isn't set, /profile is disabled
+ADMIN_TOKEN_ENV = 'SLEIGH_DASHBOARD_ADMIN_TOKEN'
+# maximum duration (in seconds) of a profile requested through /profile
+MAX_SECONDS = 600
+
+_profile_dir = os.path.join(tempfile.gettempdir(), 'sleigh-dashboard-profiles')
+
+def set_profile_dir(path: str) -> None:
+    '''Sets the directory in which profiles are written.'''
+    global _profile_dir
+    _profile_dir = path
+
+def get_profile_dir() -> str:
+    return _profile_dir
+
+
+def _frame_name(code) -> str:
+    return f'{os.path.basename(code.co_filename)}:{code.co_qualname}'
+
+
+class SamplingProfiler:
+    '''SamplingProfiler samples the stacks of the threads of this process in a background thread, between start and stop, aggregating them into folded stacks.
+
+    ATTRIBUTES:
+        interval: float
+            seconds between samples
+        session: str | None
+            if given, only work done within spans tagged with this session is sampled
+        include_idle: bool
+        stacks: Counter[str]
+            folded stack -> number of samples
+        components: Counter[str]
+            component of COMPONENTS -> number of rounds in which a thread was in it
+        samples: int
+            number of stacks sampled
+        rounds: int
+            number of times the threads were sampled
+        started: float
+        stopped: float | None
+
+    METHODS:
+        start
+        stop
+        sample
+        breakdown
+        folded
+        write
+    '''
+
+    def __init__(self, interval: float = 0.005, session: str | None = None, include_idle: bool = False):
+        self.interval = interval
+        self.session = session
+        self.include_idle = include_idle
+        self.stacks = Counter()
+        self.components = Counter()
+        self.samples = 0
+        self.rounds = 0
+        self.started = None
+        self.stopped = None
+        self._finished = threading.Event()
+        self._thread = None
+
+    def start(self) -> None:
+        self.started = time.time()
+        self._thread = threading.Thread(target=self._run, name='SamplingProfiler', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._finished.set()
+        if self._thread is not None:
+            self._thread.join()
+        if self.stopped is None:
+            self.stopped = time.time()
+
+    def _run(self) -> None:
+        while not self._finished.wait(self.interval):
+            self.sample()
+
+    def sample(self) -> None:
+        '''Takes one sample of the stack of every other thread.'''
+        self.rounds += 1
+        names = {t.ident: t.name for t in threading.enumerate()}
+        own = threading.get_ident()
+        running = set()
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own: continue
+            spans = metrics.active_spans(frame)
+            if self.session is not None and not any(s.get('session') == self.session for s in spans):
+                continue
+            frames = []
+            while frame is not None:
+                frames.append(_frame_name(frame.f_code))
+                frame = frame.f_back
+            if not frames: continue
+            # waiting (e.g. on the file loading pool) counts towards the components, but not the stacks
+            span_names = {name for s in spans for name in s['path']}
+            running.update(c for c, (kind, name) in COMPONENTS.items() if (name in frames if kind == 'frame' else name in span_names))
+            if not self.include_idle and frames[0] in IDLE_FRAMES:
+                continue
+            frames.reverse()
+            self.stacks[';'.join([names.get(thread_id, str(thread_id)), *frames])] += 1
+            self.samples += 1
+        self.components.update(running)
+
+    def breakdown(self) -> dict[str: dict]:
+        '''Returns, for each component of COMPONENTS, the number of rounds of samples in which a thread was running (or waiting) in it, and the approximate wall-clock seconds this corresponds to.'''
+        elapsed = (self.stopped or time.time()) - self.started
+        per_round = elapsed / self.rounds if self.rounds else 0.
+        return {
+            component: {'rounds': self.components[component], 'seconds': round(self.components[component]*per_round, 3)}
+            for component in COMPONENTS
+        }
+
+    def folded(self) -> str:
+        '''Returns the samples as folded stacks, most sampled first.'''
+        return ''.join(f'{stack} {n}\n' for stack, n in self.stacks.most_common())
+
+    def write(self, directory: str | None = None) -> dict:
+        '''Writes the folded stacks and the summary into directory (default get_profile_dir()), returning the summary, which includes the paths of the files.'''
+        directory = directory or _profile_dir
+        os.makedirs(directory, exist_ok=True)
+        stamp = dt.datetime.fromtimestamp(self.started).strftime('%Y%m%dT%H%M%S')
+        name = f'profile-{stamp}-{os.getpid()}' + (f'-{self.session[:12]}' if self.session else '')
+        folded_path = os.path.join(directory, f'{name}.folded')
+        summary_path = os.path.join(directory, f'{name}.json')
+        summary = {
+            'pid': os.getpid(),
+            'session': self.session,
+            'started': self.started,
+            'seconds': round((self.stopped or time.time()) - self.started, 3),
+            'interval': self.interval,
+            'samples': self.samples,
+            'rounds': self.rounds,
+            'breakdown': self.breakdown(),
+            'folded': folded_path,
+            'summary': summary_path,
+        }
+        with open(folded_path, 'w') as f:
+            f.write(self.folded())
+        with open(summary_path, 'w') as f:
+            json.dump(summary, f, indent=2)
+        print(f'SamplingProfiler.write: {self.samples} samples written to {folded_path}')
+        return summary
+
+
+_running = None
+_running_lock = threading.Lock()
+
+async def profile(seconds: float, session: str | None = None, interval: float = 0.005, include_idle: bool = False) -> dict:
+    '''Profiles the server (or the session) for seconds, then writes the profile, returning its summary. Only one profile runs at a time in a process, a RuntimeError is raised if one is already running.'''
+    global _running
+    with _running_lock:
+        if _running is not None:
+            raise RuntimeError('a profile is already running')
+        _running = SamplingProfiler(interval, session, include_idle)
+    profiler = _running
+    try:
+        profiler.start()
+        await asyncio.sleep(seconds)
+        profiler.stop()
+        return await asyncio.get_running_loop().run_in_executor(None, profiler.write)
+    finally:
+        profiler.stop()
+        with _running_lock:
+            _running = None
+
+
+class ProfileHandler(tornado.web.RequestHandler):
+    '''Profiles the server process that receives the request, for seconds (default 10), responding with the summary of the profile once it has been written. Arguments:
+        seconds: duration of the profile
+        session: id of the session to profile (default every session)
+        interval: seconds between samples (default 0.005)
+        idle: include threads waiting for work, if 1
+
+    Requests must pass the token set in the environment variable SLEIGH_DASHBOARD_ADMIN_TOKEN as the token argument, and are refused if it isn't set. The remote address isn't trusted, as behind a reverse proxy (see apache-setup.md) every request comes from localhost.
+    '''
+
+    def _is_admin(self) -> bool:
+        token = os.environ.get(ADMIN_TOKEN_ENV)
+        if not token:
+            raise tornado.web.HTTPError(403, f'profiling is disabled, as {ADMIN_TOKEN_ENV} is not set')
+        return hmac.compare_digest(self.get_argument('token', ''), token)
+
+    async def get(self):
+        if not self._is_admin():
+            raise tornado.web.HTTPError(403)
+        try:
+            seconds = float(self.get_argument('seconds', '10'))
+            interval = float(self.get_argument('interval', '0.005'))
+        except ValueError:
+            raise tornado.web.HTTPError(400, 'seconds and interval must be numbers')
+        if not 0 < seconds <= MAX_SECONDS or not 0 < interval < seconds:
+            raise tornado.web.HTTPError(400, f'seconds must be in (0, {MAX_SECONDS}] and interval in (0, seconds)')
+        session = self.get_argument('session', None) or None
+        print(f'ProfileHandler.get: profiling {"session " + session if session else "the server"} for {seconds}s')
+        try:
+            summary = await profile(seconds, session, interval, self.get_argument('idle', '0') == '1')
+        except RuntimeError as e:
+            raise tornado.web.HTTPError(409, str(e))
+        self.set_header('Content-Type', 'application/json')
+        self.write(json.dumps(summary))
+
+
+# routes to add to the server with pn.serve(..., extra_patterns=profile_patterns)
+profile_patterns = [
+    (r'/profile', ProfileHandler),
+]
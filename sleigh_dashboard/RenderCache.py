@@ -0,0 +1,110 @@
+'''Author: Andrew Martin
+Creation Date: 18/10/26
+
+Script for the RenderCache class, a process-wide cache of the HoloViews objects made by the Plottables. Building a plot (running the postproc, hvplot and combining the overlay) is repeated by every session that views the same plot over the same datetime range, so the result is cached and shared between sessions.
+
+Entries are keyed by the identity of the plottable (see plottable_identity), the datetime range, the augment flag and the versions of the DataLoaders whose data was plotted. A change to the loaded data increments a DataLoader's version, so the plots made from the old data are never served again, and are replaced the next time they are made.
+'''
+
+import threading
+import datetime as dt
+from collections import OrderedDict
+
+import pandas as pd
+
+# default number of plots held in the process-wide render cache
+DEFAULT_MAX_ENTRIES = 256
+
+
+def normalise_dtr(dtr: tuple[dt.date | dt.datetime, dt.date | dt.datetime]) -> tuple[pd.Timestamp, pd.Timestamp]:
+    '''Returns dtr as a tuple of pandas Timestamps, so that equivalent date and datetime ranges give the same cache key.'''
+    return tuple(pd.Timestamp(t) for t in dtr)
+
+
+def freeze(value, depth: int = 0):
+    '''Converts value into a hashable form that is equal for equivalent values, e.g. plotargs dictionaries. Functions are identified by their code and the values they close over, which are shared by every session.'''
+    if depth > 4:
+        return repr(value)
+    if isinstance(value, dict):
+        return tuple(sorted((str(k), freeze(v, depth+1)) for k, v in value.items()))
+    if isinstance(value, (list, tuple, set)):
+        return tuple(freeze(v, depth+1) for v in value)
+    if hasattr(value, '__func__'):
+        # bound method, identified by its function (the owner is identified separately)
+        return freeze(value.__func__, depth+1)
+    if hasattr(value, '__code__'):
+        closure = tuple(freeze(c.cell_contents, depth+1) for c in (value.__closure__ or ()))
+        return (value.__code__, closure, freeze(value.__defaults__, depth+1))
+    if isinstance(value, (str, int, float, bool, type(None))):
+        return value
+    return repr(value)
+
+
+def plottable_identity(plottable) -> tuple:
+    '''Returns a hashable identity for a plottable, which is equal for plottables of the same class with the same attributes (datasource, variable, plotargs, postproc, ...), even if they belong to different sessions. Multiplied plottables are identified by each of the plottables they combine.'''
+    identity = []
+    for owner in plottable._plotfunc_owners():
+        attrs = {k: v for k, v in vars(owner).items() if k not in ('dd', 'plotfuncs', '_cache_identity')}
+        identity.append((type(owner).__module__, type(owner).__qualname__, freeze(attrs)))
+    return tuple(identity)
+
+
+class RenderCache:
+    '''RenderCache is a thread-safe, size-limited store of plots. Once max_entries plots are held, the least recently used plot is discarded.
+
+    ATTRIBUTES:
+        max_entries: int
+        hits: int
+        misses: int
+
+    METHODS:
+        get
+        put
+        clear
+    '''
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        # key -> (data versions, plot)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: tuple, versions: tuple):
+        '''Returns the plot stored for key, or None if there isn't one made from data of the given versions.'''
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != versions:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: tuple, versions: tuple, plot) -> None:
+        '''Stores plot for key, replacing any plot made from older data.'''
+        if self.max_entries <= 0: return
+        with self._lock:
+            self._entries[key] = (versions, plot)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+# the render cache shared by every session in the process
+render_cache = RenderCache()
+
+def set_render_cache_size(max_entries: int) -> None:
+    '''Sets the number of plots held by the process-wide render cache. A size of 0 disables caching.'''
+    render_cache.max_entries = max_entries
+    with render_cache._lock:
+        while len(render_cache._entries) > max(max_entries, 0):
+            render_cache._entries.popitem(last=False)
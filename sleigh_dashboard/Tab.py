@@ -12,7 +12,12 @@ datetime range picker that can be linked to a global datetime picker if desired.
 import panel as pn
 from .DataLoader import DataLoader
 from .Plottables import BasePlottable
+from .RenderCache import normalise_dtr, freeze
+from .Metrics import metrics, tags, session_id
 import xarray as xr
+import threading
+import asyncio
+from collections import OrderedDict
 
 import datetime as dt
 
@@ -20,6 +25,144 @@ _dt_now = dt.datetime.now()
 _today = dt.date(year=_dt_now.year, month=_dt_now.month, day=_dt_now.day)
 _default_dtr = (_today-dt.timedelta(days=1), _today)
 
+class DerivedVariable:
+    '''DerivedVariable describes a variable that is calculated from the data of a single DataLoader, e.g. the net radiation from its upwelling and downwelling components. Derived variables are given to a Tab, and are calculated at most once for each datetime range and version of the DataLoader's data (see DerivedCache), the first time a plottable that refers to them reads the data. Plottables then refer to the derived variable by name, like any other variable.
+
+    ATTRIBUTES:
+        datasource: str
+            name of the DataLoader whose data the variable is calculated from, and added to
+        name: str
+        func: callable[xr.Dataset] -> xr.DataArray
+            function that calculates the variable from the data of datasource
+        requires: list[str]
+            names of other derived variables of datasource that func uses, which are calculated first
+    '''
+
+    def __init__(self, datasource: str, name: str, func: callable, requires: list[str] = []):
+        self.datasource = datasource
+        self.name = name
+        self.func = func
+        self.requires = list(requires)
+
+    @property
+    def identity(self) -> tuple:
+        return (self.datasource, self.name, freeze(self.func), tuple(self.requires))
+
+    def __repr__(self):
+        return f'DerivedVariable({self.datasource}.{self.name})'
+
+
+class DerivedCache:
+    '''DerivedCache holds the derived variables calculated for a Tab, shared by the DataBundles passed to all of its plottables, so that each variable is calculated at most once for each DataLoader, datetime range, augment flag and DataLoader version. Only the entries of the most recent max_entries datasets are kept.
+
+    ATTRIBUTES:
+        max_entries: int
+
+    METHODS:
+        derive
+    '''
+
+    def __init__(self, max_entries: int = 4):
+        self.max_entries = max_entries
+        # {(datasource, datetime range, augment, version): {name: xr.DataArray}}
+        self._entries = OrderedDict()
+        # plottables may be rendered concurrently, but each variable is only calculated once
+        self._lock = threading.Lock()
+
+    def derive(self, ds: xr.Dataset, key: tuple, derived: list[DerivedVariable], names: set[str] | None = None) -> dict[str: xr.DataArray]:
+        '''Returns the variables of derived called names (every variable if None), and the variables they require, calculated from ds. Variables already calculated for key are reused.'''
+        by_name = {dv.name: dv for dv in derived}
+        with self._lock:
+            values = self._entries.get(key)
+            if values is None:
+                values = self._entries[key] = {}
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            self._entries.move_to_end(key)
+
+            def calculate(dv: DerivedVariable, stack: tuple[str] = ()):
+                if dv.name in values or dv.name in stack: return
+                for name in dv.requires:
+                    if name in by_name: calculate(by_name[name], (*stack, dv.name))
+                try:
+                    values[dv.name] = dv.func(ds.assign(values))
+                except Exception as e:
+                    print(f'DerivedCache.derive: unable to calculate {dv.datasource}.{dv.name}: {type(e).__name__}: {e}')
+
+            wanted = [dv for dv in derived if names is None or dv.name in names]
+            for dv in wanted:
+                calculate(dv)
+            # the requested variables and everything they require
+            required, stack = set(), list(wanted)
+            while stack:
+                dv = stack.pop()
+                if dv.name in required: continue
+                required.add(dv.name)
+                stack.extend(by_name[name] for name in dv.requires if name in by_name)
+            return {name: values[name] for name in required if name in values}
+
+
+class DataBundle(dict):
+    '''DataBundle is the dict of {DataLoader name: xr.Dataset} passed from a Tab to its plottables. It also records the datetime range, augment flag and DataLoader versions the data was made from, which together identify the data for the RenderCache (see Plottables.BasePlottable._plot).
+
+    The derived variables of a DataLoader are added when its data is read from the bundle: only those in variables (see select), or all of them if variables is None. They are taken from the Tab's DerivedCache, and added to a copy of the dataset, so the data held by the DataLoader (and shared with other sessions) is never modified.
+
+    ATTRIBUTES:
+        dtr: tuple[dt.date, dt.date]
+        augment: bool
+        versions: dict[str: int]
+        derived: dict[str: list[DerivedVariable]]
+        derived_cache: DerivedCache
+        variables: set[str] | None
+            names of the variables that will be read from the bundle, of which the derived variables are added
+        cache_key: tuple
+        tags: dict[str: str]
+            metrics tags (e.g. tab and session) of the work done with the bundle's data
+
+    METHODS:
+        select
+    '''
+
+    def __init__(self, data: dict[str: xr.Dataset], dtr, augment: bool, versions: dict[str: int], derived: list[DerivedVariable] = [], tags: dict[str: str] = {}, derived_cache: DerivedCache | None = None, variables: set[str] | None = None):
+        super().__init__(data)
+        self.dtr = dtr
+        self.augment = augment
+        self.versions = versions
+        self.tags = dict(tags)
+        self.derived = {}
+        for dv in derived:
+            self.derived.setdefault(dv.datasource, []).append(dv)
+        self._derived_list = list(derived)
+        self._derived_key = tuple(dv.identity for dv in derived)
+        self.derived_cache = derived_cache if derived_cache is not None else DerivedCache()
+        self.variables = None if variables is None else set(variables)
+        # datasets with their derived variables added, {datasource: xr.Dataset}
+        self._datasets = {}
+
+    @property
+    def cache_key(self) -> tuple:
+        '''Returns (datetime range, augment, derived variables), which is equal for bundles holding the same data if their versions are also equal.'''
+        return (normalise_dtr(self.dtr), self.augment, self._derived_key)
+
+    def select(self, variables: list[str] | None) -> 'DataBundle':
+        '''Returns a bundle of the same data (and DerivedCache), which only adds the derived variables among variables (and those they require).'''
+        return DataBundle(dict(self.items()), self.dtr, self.augment, self.versions, self._derived_list, self.tags, self.derived_cache, variables)
+
+    def __getitem__(self, datasource: str) -> xr.Dataset:
+        ds = dict.__getitem__(self, datasource)
+        if ds is None or datasource not in self.derived:
+            return ds
+        if datasource not in self._datasets:
+            key = (datasource, normalise_dtr(self.dtr), self.augment, self.versions.get(datasource))
+            with tags(**self.tags), metrics.span('derive', loader=datasource):
+                values = self.derived_cache.derive(ds, key, self.derived[datasource], self.variables)
+            self._datasets[datasource] = ds.assign(values) if values else ds
+        return self._datasets[datasource]
+
+    def get(self, datasource: str, default=None) -> xr.Dataset:
+        return self[datasource] if datasource in self else default
+
+
 class Tab:
     '''
     The Tab class provides all of the functionality of an individual viewable tab in
@@ -36,7 +179,8 @@ class Tab:
         dld: dict[str: DataLoader] | None,
         required_DL: list[str],
         longname: str | None = None,
-        augment_dims: bool = False # used to rename data dims in event that Tab is a comparison tab...
+        augment_dims: bool = False, # used to rename data dims in event that Tab is a comparison tab...
+        derived: list[DerivedVariable] = []
     ):
         self.name = name
         
@@ -50,6 +194,13 @@ class Tab:
         self.required_DL = required_DL
         self.plottables = plottables
         self.augment_dims = augment_dims
+        # a Tab that isn't visible (see set_visible) doesn't follow the global datetime picker, but records its latest range in pending_dtr
+        self.visible = True
+        self.pending_dtr = None
+        # variables calculated from the loaded data, which the plottables can refer to by name
+        self.derived = list(derived)
+        # the derived variables calculated for the most recent data, shared by the bundles given to every plottable
+        self.derived_cache = DerivedCache()
 
         self.data = pn.bind(self._bind_data, self.dtp)
 
@@ -70,8 +221,14 @@ class Tab:
         print(f'Tab {self.name}.__init__(): {self.plottables=}')
 
     
-    def _data_column(self, dtr):
+    def _data_column(self):
         print(f'Tab {self.name}._data_column running')
+        with tags(tab=self.name, session=session_id()), metrics.span('data_column'):
+            return self._build_data_column()
+
+    def _build_data_column(self):
+        # the column is built when the tab is first displayed, which may be before set_visible is called
+        self._apply_pending()
         data_column_objs = []
         for p in self.plottables:
             p(self.data)
@@ -87,19 +244,41 @@ class Tab:
 
 
     def __panel__(self):
-        '''Function that returns the panel-viewable object that is the tab content. This will be the top row containing the tab title, the datetime picker for the tab; and the scrollable column containing the actual plots. This will have a spacer on the left and right to allow for scrolling of the plots easily.'''
-        dc = pn.bind(self._data_column, self.dtp)
+        '''Function that returns the panel-viewable object that is the tab content. This will be the top row containing the tab title, the datetime picker for the tab; and the scrollable column containing the actual plots. This will have a spacer on the left and right to allow for scrolling of the plots easily.
+
+        The column of plots is built lazily, i.e. not until the tab is first displayed. It is only built once: the plottables are bound to self.data, so they update themselves when the datetime range changes.'''
+        dc = pn.panel(pn.bind(self._data_column), lazy=True)
         return pn.Column(self.top_row, dc)
     
     def _bind_gdtp_val(self, gdtr):
         print(f'#### Tab {self.name}._bind_gdtp_val: {gdtr=}')
         self.dtp.value = gdtr
 
+    def _on_gdtp_change(self, event):
+        '''Watcher of the global datetime picker. Visible tabs follow it immediately, hidden tabs only record the new range, which is applied by set_visible.'''
+        if self.visible:
+            self.dtp.value = event.new
+        else:
+            self.pending_dtr = event.new
+
+    def set_visible(self, visible: bool) -> None:
+        '''Sets whether the tab is being displayed. A tab that becomes visible applies any datetime range it missed while hidden, which loads and plots the data for that range.'''
+        self.visible = visible
+        if visible: self._apply_pending()
+
+    def _apply_pending(self) -> None:
+        if self.pending_dtr is not None:
+            pending, self.pending_dtr = self.pending_dtr, None
+            print(f'#### Tab {self.name}._apply_pending: {pending=}')
+            self.dtp.value = pending
+
     def bind_gdtp(self, gdtp: pn.widgets.DateRangePicker):
         self.gdtp = gdtp
-        self.dtp.value = self.gdtp
+        self.dtp.value = self.gdtp.value
         self.dtp.start = self.gdtp.start
         self.dtp.end = self.gdtp.end
+        # changes in the global dtp reflect in the local one, but only while the tab is visible
+        gdtp.param.watch(self._on_gdtp_change, 'value')
         #pn.bind(self._bind_gdtp_val, self.gdtp)
         print(f'#### Tab {self.name}.bind_gdtp complete')
         '''
@@ -108,20 +287,22 @@ class Tab:
             start=gdtp.start, end=gdtp.end, 
         )
         '''
-        # binds the Tab objects datetime picker to the global one. Changes in the global dtp reflect in the local one.
-        #self.dtp.value = self.gdtp.value
         return
     
 
-    def _bind_data(self, dtr) -> dict[str:xr.Dataset]:
+    async def _bind_data(self, dtr) -> DataBundle:
         print(f'Tab. {self.name}_bind_data({self.augment_dims=})')
-        # data needs rebinding each time that the dtp is updated
+        # data needs rebinding each time that the dtp is updated. The DataLoaders read their files concurrently, in an executor, so the event loop isn't blocked
         if self.dld is not None:
-            data = {
-                inst: self.dld[inst](dtr, self.augment_dims)
-                for inst in self.required_DL
-            }
-            return data
+            bundle_tags = {'tab': self.name, 'session': session_id()}
+            with tags(**bundle_tags), metrics.span('bind_data'):
+                results = await asyncio.gather(*[
+                    self.dld[inst].fetch(dtr, self.augment_dims)
+                    for inst in self.required_DL
+                ])
+            data = {inst: ds for inst, (ds, _) in zip(self.required_DL, results)}
+            versions = {inst: version for inst, (_, version) in zip(self.required_DL, results)}
+            return DataBundle(data, dtr, self.augment_dims, versions, self.derived, bundle_tags, self.derived_cache)
         else: return None
 
 
@@ -29,20 +29,35 @@ class TabView:
         for tab in tablist:
             tab.dld = self.dld
             tab.augment_dims = augment_dims
+        self.tabs = None
             
 
     def __call__(self) -> pn.Tabs:
-        return pn.Tabs(
-            *[(t.name, t) for t in self.tablist],
-            sizing_mode='stretch_both', dynamic=True
-        )
+        # a single pn.Tabs is kept, so that the visibility of the tabs follows its active tab
+        if self.tabs is None:
+            self.tabs = pn.Tabs(
+                *[(t.name, t) for t in self.tablist],
+                sizing_mode='stretch_both', dynamic=True
+            )
+            self.tabs.param.watch(self._on_active_change, 'active')
+            self._set_active(self.tabs.active)
+        return self.tabs
 
     def __panel__(self):
         return self.__call__()
     
+    def _on_active_change(self, event):
+        self._set_active(event.new)
+
+    def _set_active(self, active: int) -> None:
+        '''Marks only the tab at index active as visible. The newly visible tab is updated first, then the others stop following the global datetime picker.'''
+        self.tablist[active].set_visible(True)
+        for i, t in enumerate(self.tablist):
+            if i != active: t.set_visible(False)
+
 
     def bind_gdtp(self, gdtp):
-        '''Function that binds a global DateRangePicker object to the individual Tab objects in the TabView.'''
+        '''Function that binds a global DateRangePicker object to the individual Tab objects in the TabView. Only the visible tab follows changes to gdtp straight away; the others update when they are selected.'''
         self.gdtp = gdtp
         for t in self.tablist:
             t.bind_gdtp(gdtp)
@@ -0,0 +1,95 @@
+'''Author: Andrew Martin
+Creation Date: 18/10/26
+
+Script for the Warmup class, which warms up the process-wide caches in the background when the server starts, so that the first visitor after a restart doesn't pay the full cost of loading (and plotting) the default datetime range. The last N days are loaded into every DataLoader of the DataLoaderRegistry, and optionally the default view of each tab is plotted into the render_cache.
+
+The warm-up runs in a thread of each server process, started once the server's port is bound (see dashboard.py), so it never delays the server from accepting sessions. Sessions requesting data that is still being loaded wait for the DataLoader, rather than loading it again.
+'''
+
+import asyncio
+import datetime as dt
+import threading
+import time
+
+from .Metrics import tags
+
+
+class Warmup(threading.Thread):
+    '''Warmup is a background thread loading the last days of data into the shared DataLoaders and, if render=True, plotting the default view of each tab.
+
+    ATTRIBUTES:
+        create_dld: callable -> dict[str: DataLoader]
+            function returning the (shared) DataLoaders to warm up, e.g. dashboard_instrument.create_dld
+        days: int
+            number of days before today to load
+        tabview_funcs: list[callable]
+            functions (dld, augment) -> TabView, whose tabs are rendered if render=True
+        dtr: tuple[dt.date, dt.date]
+            datetime range of the default view
+        render: bool
+        loaded: list[str]
+        rendered: list[str]
+
+    METHODS:
+        run
+        load
+        render_tabs
+    '''
+
+    def __init__(self,
+        create_dld: callable,
+        days: int,
+        tabview_funcs: list[callable] = [],
+        dtr: tuple[dt.date, dt.date] | None = None,
+        render: bool = False,
+    ):
+        super().__init__(name='Warmup', daemon=True)
+        self.create_dld = create_dld
+        self.days = days
+        self.tabview_funcs = list(tabview_funcs)
+        today = dt.date.today()
+        self.dtr = dtr if dtr is not None else (today - dt.timedelta(days=1), today)
+        self.render = render
+        self.loaded = []
+        self.rendered = []
+
+    def run(self):
+        t0 = time.perf_counter()
+        print(f'Warmup.run: warming up the last {self.days} days{" and the default view of each tab" if self.render else ""}')
+        # spans recorded during the warm-up are tagged as the warmup session (see Metrics)
+        with tags(session='warmup'):
+            dld = self.create_dld()
+            self.load(dld)
+            if self.render:
+                asyncio.run(self.render_tabs(dld))
+        print(f'Warmup.run: complete in {time.perf_counter()-t0:.1f}s, {len(self.loaded)} DataLoaders loaded, {len(self.rendered)} tabs rendered')
+
+    def load(self, dld: dict) -> None:
+        '''Loads the last days of data into each DataLoader of dld.'''
+        today = dt.date.today()
+        dtr = (today - dt.timedelta(days=self.days), today)
+        for i, (name, loader) in enumerate(dld.items()):
+            t0 = time.perf_counter()
+            try:
+                loader.update_data(dtr)
+            except Exception as e:
+                print(f'Warmup.load: failed to load {name}: {e}')
+                continue
+            self.loaded.append(name)
+            print(f'Warmup.load: loaded {name} ({i+1}/{len(dld)}) in {time.perf_counter()-t0:.1f}s')
+
+    async def render_tabs(self, dld: dict) -> None:
+        '''Plots the default view of the tabs of each TabView into the render_cache.'''
+        tablist = [tab for func in self.tabview_funcs for tab in func(dld, False).tablist]
+        for i, tab in enumerate(tablist):
+            t0 = time.perf_counter()
+            try:
+                dd = await tab._bind_data(self.dtr)
+                with tags(tab=tab.name):
+                    for p in tab.plottables:
+                        p._plot_data(dd)
+            except Exception as e:
+                print(f'Warmup.render_tabs: failed to render {tab.name}: {e}')
+                continue
+            self.rendered.append(tab.name)
+            print(f'Warmup.render_tabs: rendered {tab.name} ({i+1}/{len(tablist)}) in {time.perf_counter()-t0:.1f}s')
@@ -1,5 +1,26 @@
-from . import Dashboard
-from . import DataLoader
-from . import Plottables
-from . import Tab
-from . import TabView
\ No newline at end of file
+'''The submodules of sleigh_dashboard are imported on first access (e.g. sleigh_dashboard.DataLoader), so that the data layer can be imported without the plotting stack (holoviews, hvplot, panel) that Plottables, Tab, TabView and Dashboard import.'''
+import importlib
+
+__all__ = [
+    'ChunkStore',
+    'Dashboard',
+    'DataLoader',
+    'DataLoaderRegistry',
+    'DirectoryIndex',
+    'Downsample',
+    'Metrics',
+    'Plottables',
+    'Profiler',
+    'RenderCache',
+    'Tab',
+    'TabView',
+    'Warmup',
+]
+
+def __getattr__(name):
+    if name in __all__:
+        return importlib.import_module(f'.{name}', __name__)
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+def __dir__():
+    return sorted([*globals(), *__all__])
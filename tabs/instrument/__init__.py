@@ -1,9 +1,22 @@
-from . import tab_asfs
-from . import tab_cl61
-from . import tab_gfs
-from . import tab_gpr
-from . import tab_mrr
-from . import tab_mvp
-from . import tab_mwr
-from . import tab_simba
-from . import tab_turb
\ No newline at end of file
+'''The tab modules are imported on first access (e.g. tabs.instrument.tab_asfs), as each imports the plotting stack.'''
+import importlib
+
+__all__ = [
+    'tab_asfs',
+    'tab_cl61',
+    'tab_gfs',
+    'tab_gpr',
+    'tab_mrr',
+    'tab_mvp',
+    'tab_mwr',
+    'tab_simba',
+    'tab_turb',
+]
+
+def __getattr__(name):
+    if name in __all__:
+        return importlib.import_module(f'.{name}', __name__)
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+def __dir__():
+    return sorted([*globals(), *__all__])
@@ -4,14 +4,14 @@ warnings.filterwarnings("once")
 from sleigh_dashboard import DataLoader, Plottables, Tab
 
 def DL_asfs_slow():
-    return DataLoader.DataLoader('asfs', '/data/asfs','summary_asfs_slow_%Y%m%d.nc')
+    return DataLoader.DataLoader('asfs', DataLoader.data_path('asfs'),'summary_asfs_slow_%Y%m%d.nc', pyramid=['10min', '1h'])
 
 class asfsplot(Plottables.Plot_line_scatter):
     def __init__(self, variable: str | list[str], plotargs: dict, title ,augment=False, postproc=(lambda x:x)):
         plotargs['x'] = 'time'
         plotargs['xlabel'] = 'time'
         if augment: plotargs['x'] = 'time_'
-        super().__init__('asfs', variable, plotargs, postproc=postproc)
+        super().__init__('asfs', variable, plotargs, postproc=postproc, downsample=True)
         self.plotargs['title'] = title
 
 
@@ -39,14 +39,14 @@ def get_asfs_tab(augment=False):
         asfsplot('sr30_swd_heatA_mean', {'label':'SWD'}, 'RAD HEATERS', augment=augment)
 
 
-    def pproc_rad_tilt(dd):
-        mod_180 = lambda x: (x + 90)%180 - 90
-        dd['asfs']['swu_tilt'] = mod_180(dd['asfs']['sr30_swu_tilt_mean'])
-        dd['asfs']['swd_tilt'] = mod_180(dd['asfs']['sr30_swd_tilt_mean'])
-        return dd
+    mod_180 = lambda x: (x + 90)%180 - 90
+    derived = [
+        Tab.DerivedVariable('asfs', 'swu_tilt', lambda ds: mod_180(ds['sr30_swu_tilt_mean'])),
+        Tab.DerivedVariable('asfs', 'swd_tilt', lambda ds: mod_180(ds['sr30_swd_tilt_mean'])),
+    ]
     p_rad_tilt = \
-        asfsplot('swu_tilt', {'label':'SWU', 'ylabel':'tilt (deg)'}, 'SW RADIOMEER TILT', postproc=pproc_rad_tilt, augment=augment) *\
-        asfsplot('swd_tilt', {'label':'SWD'}, 'SW RADIOMETER TILT', postproc=pproc_rad_tilt, augment=augment)
+        asfsplot('swu_tilt', {'label':'SWU', 'ylabel':'tilt (deg)'}, 'SW RADIOMEER TILT', augment=augment) *\
+        asfsplot('swd_tilt', {'label':'SWD'}, 'SW RADIOMETER TILT', augment=augment)
     
     p_metek_tilt = \
         asfsplot('metek_InclX_mean', {'label':'X', 'ylabel':'tilt (deg)'}, 'SONIC TILT', augment=augment) *\
@@ -73,7 +73,8 @@ def get_asfs_tab(augment=False):
         dld=None,
         required_DL=['asfs'],
         longname='Atmospheric Surface Flux Station',
-        augment_dims=augment
+        augment_dims=augment,
+        derived=derived
     )
     return asfs_tab
 
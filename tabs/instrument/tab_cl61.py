@@ -4,7 +4,8 @@ warnings.filterwarnings("once")
 from sleigh_dashboard import DataLoader, Plottables, Tab
 
 def DL_cl61():
-    return DataLoader.DataLoader('cl61', '/data/cl61/daily', 'summary_cl61_%Y%m%d.nc')
+    # the range-resolved lidar fields are large and few of them are plotted, so they are only read when required
+    return DataLoader.DataLoader('cl61', DataLoader.data_path('cl61', 'daily'), 'summary_cl61_%Y%m%d.nc', lazy=True)
 
 class lidarplot(Plottables.Plot_2D):
     def __init__(self, variable, title, clim, cmap='viridis', cnorm='linear', augment=False):
@@ -12,7 +13,7 @@ class lidarplot(Plottables.Plot_2D):
             'x':'time', 'y':'range', 'ylabel':'Height AGL (m)', 'xlabel':'time', 'ylim':(0,5000)
         }
         if augment: pargs.update({'x':'time_', 'y':'range_'})
-        super().__init__('cl61', variable, pargs, cmap=cmap, cnorm=cnorm, clim=clim)
+        super().__init__('cl61', variable, pargs, cmap=cmap, cnorm=cnorm, clim=clim, rasterize=True)
         self.plotargs['title']=title
 
 def get_lidar_tab(augment=False):
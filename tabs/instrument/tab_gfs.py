@@ -3,10 +3,30 @@ warnings.filterwarnings("once")
 
 import xarray as xr
 import numpy as np
+import pandas as pd
 import datetime as dt
+import bisect
+import holoviews as hv
 
 from sleigh_dashboard import DataLoader, Plottables, Tab
 
+# colours of the shortest and longest lead time forecasts, between which the points of the recency plots are coloured
+RECENCY_COLOURS = ('#08306b', '#9ecae1')
+# number of colours in the recency palette
+RECENCY_LEVELS = 64
+
+
+def recency_alpha(x):
+    '''Returns the alpha of forecast points with recency (lead time) x, as a fraction of the longest lead time.'''
+    return (1 - x) * np.exp(-4*np.power(x,2))
+
+def _recency_palette(colours: tuple[str, str], levels: int) -> np.ndarray:
+    '''Returns an array of levels hex colours interpolated between colours.'''
+    ends = np.array([[int(c[i:i+2], 16) for i in (1, 3, 5)] for c in colours], dtype=float)
+    rgb = np.rint(ends[0] + np.linspace(0, 1, levels)[:, None] * (ends[1] - ends[0])).astype(int)
+    return np.array([f'#{r:02x}{g:02x}{b:02x}' for r, g, b in rgb])
+
+_palette = _recency_palette(RECENCY_COLOURS, RECENCY_LEVELS)
 
 
 def preproc_GFS(gfs):
@@ -17,30 +37,99 @@ def preproc_GFS(gfs):
     )
     gfs['recency'] = (gfs.time - gfs.init_time)
     
-    #f_alpha = lambda x,n: 0.1+ 0.9* ( 1 - np.power(x,n))
-    f_alpha = lambda x,n: (1 - x) * np.exp(-4*np.power(x,2))
-    
     #gfs['recency_alpha'] = 1 - 0.9 * gfs['recency'] / np.max(gfs['recency'])
     
-    gfs['recency_alpha']=f_alpha( gfs['recency']/np.max(gfs['recency']), 0.25)
+    gfs['recency_alpha']=recency_alpha( gfs['recency']/np.max(gfs['recency']) )
 
     return gfs
 
 
 
 class DataLoader_GFS(DataLoader.DataLoader):
-    def _get_files_from_dtr(self, dtr: tuple[dt.datetime, dt.datetime]) -> list[str]:
-        flist = super()._get_files_from_dtr(dtr)
-
-        flist_list = [ [f.replace('*',tstr) for f in flist] for tstr in ['00','06','12','18']]
-        return [v for fl in flist_list for v in fl]
+    '''DataLoader for the GFS forecast files, of which there is one per forecast cycle (four per day). The cycle hour is matched by the * in the filename format.
+
+    The loaded cycles are indexed by their init time and the last valid time of their forecast. A datetime range is treated as a window of valid times: at each valid time from the start of the window, only the recent_cycles most recent cycles initialised by then are served (and past the end of the window, the most recent cycles initialised by its end), so the size of the served data depends on the window rather than on how many cycles are loaded. Only the cycles that can be served for the window are loaded, and once more than max_cycles are loaded, the cycles with the oldest init times that aren't served for the latest window are dropped from memory.
+
+    ATTRIBUTES:
+        recent_cycles: int
+        max_cycles: int
+        max_lead: pd.Timedelta
+            longest forecast lead time, cycles initialised more than max_lead before a window can't cover it
+        cycles: list[tuple[np.datetime64, np.datetime64, str]]
+            (init time, last valid time, filename) of each loaded cycle, sorted by init time
+    '''
+
+    def __init__(self, *args, recent_cycles: int = 8, max_cycles: int = 56, max_lead: str = '16D', **kwargs):
+        # set before the DataLoader is initialised, as it may load data (init_dtr)
+        self.recent_cycles = recent_cycles
+        self.max_cycles = max_cycles
+        self.max_lead = pd.Timedelta(max_lead)
+        self.cycles = []
+        super().__init__(*args, **kwargs)
+
+    def _get_files_from_dtr(self, dtr):
+        '''Returns the files of the cycles initialised within dtr, and of the recent_cycles cycles before it, which cover its start.'''
+        start, end = pd.Timestamp(dtr[0]).date(), pd.Timestamp(dtr[1]).date()
+        files = super()._get_files_from_dtr((start - self.max_lead, end))
+        first = bisect.bisect_left(files, (start, ''))
+        return files[max(0, first - self.recent_cycles):]
+
+    def _update_data(self, dtr):
+        super()._update_data(dtr)
+        self._retain(dtr)
+
+    def _retain(self, dtr) -> None:
+        '''Drops the cycles with the oldest init times until at most max_cycles are loaded, keeping those served for dtr.'''
+        if len(self.chunks) <= self.max_cycles: return
+        served = {c.fname for c in self._select_chunks(dtr)}
+        for _, fname in list(self._index):
+            if len(self.chunks) <= self.max_cycles: break
+            if fname not in served: self._evict(fname)
+
+    def _add_chunk(self, chunk):
+        super()._add_chunk(chunk)
+        self._drop_cycle(chunk.fname)
+        bisect.insort(self.cycles, (chunk.data.init_time.values[0], chunk.data['time'].values.max(), chunk.fname))
+
+    def _evict(self, fname):
+        with self._lock:
+            super()._evict(fname)
+            self._drop_cycle(fname)
+
+    def _drop_cycle(self, fname: str) -> None:
+        self.cycles = [c for c in self.cycles if c[2] != fname]
+
+    def _select_chunks(self, dtr):
+        '''Returns the loaded cycles that are served for the window dtr: those initialised within it, and the recent_cycles most recent cycles initialised by its start whose forecasts reach it.'''
+        start, end = np.datetime64(pd.Timestamp(dtr[0])), np.datetime64(pd.Timestamp(dtr[1]))
+        inits = [init for init, _, _ in self.cycles]
+        first = bisect.bisect_right(inits, start)
+        last = bisect.bisect_right(inits, end)
+        before = [c for c in self.cycles[:first] if c[1] >= start][-self.recent_cycles:]
+        return [self.chunks[fname] for _, _, fname in before + self.cycles[first:last]]
+
+    def _slice(self, ds, dtr):
+        '''Masks each cycle of ds outside of the valid times at which it is one of the recent_cycles most recent cycles, and before the start of dtr, dropping the cycles and lead times that are masked entirely.'''
+        start = np.datetime64(pd.Timestamp(dtr[0]))
+        inits = ds.init_time.values
+        valid = ds['time'].values
+        # the rank of a cycle at a valid time is the number of cycles initialised after it, by then
+        rank = np.searchsorted(inits, valid, side='right') - 1 - np.arange(inits.size)[:, None]
+        mask = (rank < self.recent_cycles) & (valid >= start)
+        ds = ds.isel(init_time=mask.any(axis=1), time_index=mask.any(axis=0))
+        mask = xr.DataArray(mask[mask.any(axis=1)][:, mask.any(axis=0)], dims=('init_time', 'time_index'))
+        return ds.assign({
+            v: da.where(mask) for v, da in ds.data_vars.items()
+            if 'init_time' in da.dims and 'time_index' in da.dims
+        })
 
 
 def DL_gfs():
-    return DataLoader_GFS('gfs', '/data/weather/GFS', 'Raven_GFS_Global_0p5deg_%Y%m%d_*00.nc', sortby_dim='init_time', concat_dim = 'init_time', file_preproc=preproc_GFS)
+    return DataLoader_GFS('gfs', DataLoader.data_path('weather', 'GFS'), 'Raven_GFS_Global_0p5deg_%Y%m%d_*00.nc', sortby_dim='init_time', concat_dim = 'init_time', file_preproc=preproc_GFS, refresh_dim=None, max_workers=4, recent_cycles=8, max_cycles=56)
 
 class gfs_recency_alpha_plot(Plottables.Plot_scatter):
-    def __init__(self, variable, title, plotargs={}, augment=False):
+    '''Scatter plot of a GFS variable against valid time for every served forecast cycle, in which each point is faded and coloured by its recency (lead time). The points of every cycle are drawn by a single glyph, with their alpha and colour computed here, so the size of the plot doesn't grow with the number of cycles.'''
+    def __init__(self, variable, title, plotargs={}, augment=False, max_lead='16D'):
         plotargs['x'] = 'time'
         plotargs['xlabel'] = 'time'
         if augment: plotargs['x'] = 'time_'
@@ -50,11 +139,30 @@ class gfs_recency_alpha_plot(Plottables.Plot_scatter):
         self.plotfuncs=[self.plot]
         self.by = 'init_time'
         if augment: self.by += '_'
+        self.max_lead = np.timedelta64(pd.Timedelta(max_lead))
 
     def plot(self, dd):
         try:
-            dd = self.postproc(dd)
-            return dd['gfs'].hvplot.scatter(y=self.variable, alpha='recency_alpha', **self.plotargs, by=self.by)
+            ds = self._postproc(dd)[self.datasource]
+            da = ds[self.variable]
+            x = ds[self.plotargs['x']].broadcast_like(da).transpose(*da.dims).values.ravel()
+            y = da.values.ravel()
+            recency = ds['recency'].broadcast_like(da).transpose(*da.dims).values.ravel()
+            init = ds[self.by].broadcast_like(da).transpose(*da.dims).values.ravel()
+            keep = ~np.isnan(y) & ~np.isnat(recency)
+            frac = np.clip(recency[keep] / self.max_lead, 0, 1)
+            points = hv.Points(
+                {self.plotargs['x']: x[keep], self.variable: y[keep], self.by: init[keep],
+                 'colour': _palette[np.rint(frac * (RECENCY_LEVELS-1)).astype(int)], 'alpha': recency_alpha(frac)},
+                kdims=[self.plotargs['x'], self.variable], vdims=[self.by, 'colour', 'alpha'],
+                label=self.plotargs['label'],
+            )
+            return points.opts(
+                color='colour', alpha='alpha', size=self.plotargs['s'], marker=self.plotargs['marker'],
+                title=self.plotargs['title'], xlabel=self.plotargs['xlabel'], ylabel=self.variable,
+                height=self.plotargs['height'], responsive=self.plotargs.get('responsive', True), show_grid=self.plotargs['grid'],
+                tools=['hover'], hover_tooltips=[self.plotargs['x'], self.variable, self.by], show_legend=False,
+            )
         except Exception as e:
             return e
         
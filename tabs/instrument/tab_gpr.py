@@ -4,9 +4,9 @@ warnings.filterwarnings("once")
 from sleigh_dashboard import DataLoader, Plottables, Tab
 
 def DL_gpr5():
-    return DataLoader.DataLoader('gpr5', '/data/gpr', 'summary_gpr_5G_%Y%m%d.nc')
+    return DataLoader.DataLoader('gpr5', DataLoader.data_path('gpr'), 'summary_gpr_5G_%Y%m%d.nc')
 def DL_gpr7():
-    return DataLoader.DataLoader('gpr7', '/data/gpr', 'summary_gpr_7G_%Y%m%d.nc')
+    return DataLoader.DataLoader('gpr7', DataLoader.data_path('gpr'), 'summary_gpr_7G_%Y%m%d.nc')
 
 class gprplot_2d(Plottables.Plot_2D):
     def __init__(self, gpr, variable, title, clim=(None, None), cmap='viridis', cnorm='linear', augment=False):
@@ -14,7 +14,7 @@ class gprplot_2d(Plottables.Plot_2D):
             'x': 'time', 'y':'step', 'xlabel':'time', 'ylabel':'step', 'flip_yaxis':True
         }
         if augment: pargs.update({'x':'time_', 'y':'step_'})
-        super().__init__(f'gpr{gpr}', variable, pargs, cmap=cmap, cnorm=cnorm, clim=clim)
+        super().__init__(f'gpr{gpr}', variable, pargs, cmap=cmap, cnorm=cnorm, clim=clim, rasterize=True)
         self.plotargs['title'] = title
 
 
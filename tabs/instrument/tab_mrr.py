@@ -4,7 +4,8 @@ warnings.filterwarnings("once")
 from sleigh_dashboard import DataLoader, Plottables, Tab
 
 def DL_mrr():
-    return DataLoader.DataLoader('mrr','/data/mrr', 'summary_mrr_%Y%m%d.nc')
+    # the range-resolved radar fields are large and few of them are plotted, so they are only read when required
+    return DataLoader.DataLoader('mrr',DataLoader.data_path('mrr'), 'summary_mrr_%Y%m%d.nc', lazy=True)
 
 class radarplot(Plottables.Plot_2D):
     def __init__(self, variable, title, clim, cmap='viridis', cnorm='linear',augment=False):
@@ -12,7 +13,7 @@ class radarplot(Plottables.Plot_2D):
             'x':'time', 'y':'range_bins','ylabel':'height AGL (m)','xlabel':'time'
         }
         if augment: pargs.update({'x':'time_', 'y':'range_bins_'})
-        super().__init__('mrr',variable,pargs, cmap=cmap, clim=clim, cnorm=cnorm)
+        super().__init__('mrr',variable,pargs, cmap=cmap, clim=clim, cnorm=cnorm, rasterize=True)
         self.plotargs['title'] = title
 
 
@@ -35,7 +35,7 @@ def mvp_load_preproc(mvp):
     return mvp
 
 def DL_mvp():
-    return DataLoader.DataLoader('mvp', '/data/power/level2', 'power.mvp.level2.1min.%Y%m%d.000000.nc', file_preproc=mvp_load_preproc)
+    return DataLoader.DataLoader('mvp', DataLoader.data_path('power', 'level2'), 'power.mvp.level2.1min.%Y%m%d.000000.nc', file_preproc=mvp_load_preproc, max_workers=4, pyramid=['10min', '1h'])
 
 class mvp_dials_plot(Plottables.BasePlottable):
     def __init__(self):
@@ -90,7 +90,7 @@ class mvp_dials_plot(Plottables.BasePlottable):
 
 class Plot_MultiY_scatter(Plottables.Plot_scatter):
     def __init__(self, datasource, variable, plotargs, ylims, vdims, labels, height=300, s=5):
-        super().__init__(datasource, variable, plotargs, height, s)
+        super().__init__(datasource, variable, plotargs, height, s, downsample=True)
         self.ylims = ylims
         self.vdims = vdims # TODO: fix multi_y issues
         self.labels=labels
@@ -120,7 +120,7 @@ class mvpplot_scatter(Plottables.Plot_line_scatter):
         plotargs.update({'x': 'time', 'xlabel':'time'})
         if augment: plotargs.update({'x':'time_'})
         plotargs['title'] = title
-        super().__init__('mvp',variable, plotargs)
+        super().__init__('mvp',variable, plotargs, downsample=True)
         if postproc is not None:
             self.postproc = postproc
 
@@ -4,7 +4,7 @@ warnings.filterwarnings("once")
 from sleigh_dashboard import DataLoader, Plottables, Tab
 
 def DL_mwr():
-    return DataLoader.DataLoader('mwr', '/data/mwr', 'summary_mwr_%Y%m%d.nc')
+    return DataLoader.DataLoader('mwr', DataLoader.data_path('mwr'), 'summary_mwr_%Y%m%d.nc', pyramid=['10min', '1h'], pyramid_aggregates={'HKD_AlFl_sum': 'sum'})
 
 class mwr_plot(Plottables.Plot_line_scatter):
     def __init__(self, variable, title, plotargs={}, augment=False):
@@ -4,7 +4,7 @@ warnings.filterwarnings("once")
 from sleigh_dashboard import DataLoader, Plottables, Tab
 
 def DL_simba():
-    return DataLoader.DataLoader('simba', '/data/simba', 'summary_simba_%Y%m%d.nc')
+    return DataLoader.DataLoader('simba', DataLoader.data_path('simba'), 'summary_simba_%Y%m%d.nc')
 
 
 class simbaplot_2d(Plottables.Plot_2D):
@@ -13,7 +13,7 @@ class simbaplot_2d(Plottables.Plot_2D):
             'x':'time', 'y':'height', 'xlabel':'time', 'ylabel':'Height AGL (cm)'
         }
         if augment: pargs.update({'x':'time_', 'y':'height_'})
-        super().__init__('simba',variable, pargs, cmap=cmap, cnorm=cnorm, clim=clim)
+        super().__init__('simba',variable, pargs, cmap=cmap, cnorm=cnorm, clim=clim, rasterize=True)
         self.plotargs['title'] = title
 
 
@@ -22,7 +22,7 @@ class simbaplot_scatter(Plottables.Plot_line_scatter):
         plotargs['x'] = 'time'
         plotargs['xlabel'] = 'time'
         if augment: plotargs['x'] = 'time_'
-        super().__init__('simba',variable, plotargs)
+        super().__init__('simba',variable, plotargs, downsample=True)
         self.plotargs['title'] = title
 
 def get_simba_tab(augment=False):
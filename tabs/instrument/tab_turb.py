@@ -4,14 +4,14 @@ warnings.filterwarnings("once")
 from sleigh_dashboard import DataLoader, Plottables, Tab
 
 def DL_asfs_turb():
-    return DataLoader.DataLoader('turb', '/data/asfs','summary_asfs_turb_%Y%m%d.nc')
+    return DataLoader.DataLoader('turb', DataLoader.data_path('asfs'),'summary_asfs_turb_%Y%m%d.nc', pyramid=['1h'])
 
 class asfsplot(Plottables.Plot_line_scatter):
     def __init__(self, variable: str | list[str], plotargs: dict, title ,augment=False):
         plotargs['x'] = 'time'
         plotargs['xlabel'] = 'time'
         if augment: plotargs['x'] = 'time_'
-        super().__init__('turb', variable, plotargs)
+        super().__init__('turb', variable, plotargs, downsample=True)
         self.plotargs['title'] = title
 
 
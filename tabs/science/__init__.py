@@ -1,3 +1,16 @@
-from . import tab_clouds
-from . import tab_met
-from . import tab_seb
\ No newline at end of file
+'''The tab modules are imported on first access (e.g. tabs.science.tab_met), as each imports the plotting stack.'''
+import importlib
+
+__all__ = [
+    'tab_clouds',
+    'tab_met',
+    'tab_seb',
+]
+
+def __getattr__(name):
+    if name in __all__:
+        return importlib.import_module(f'.{name}', __name__)
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+def __dir__():
+    return sorted([*globals(), *__all__])
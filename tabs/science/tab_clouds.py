@@ -10,9 +10,9 @@ warnings.filterwarnings("once")
 
 from sleigh_dashboard import DataLoader, Plottables, Tab
 
-DL_cl61 = DataLoader.DataLoader('lidar', '/data/cl61', 'summary_cl61_%Y%m%d.nc')
-DL_mrr = DataLoader.DataLoader('mrr','/data/mrr', 'summary_mrr_%Y%m%d.nc')
-DL_mwr = DataLoader.DataLoader('mwr', '/data/mwr', 'summary_mwr_%Y%m%d.nc')
+DL_cl61 = DataLoader.DataLoader('lidar', DataLoader.data_path('cl61'), 'summary_cl61_%Y%m%d.nc')
+DL_mrr = DataLoader.DataLoader('mrr',DataLoader.data_path('mrr'), 'summary_mrr_%Y%m%d.nc')
+DL_mwr = DataLoader.DataLoader('mwr', DataLoader.data_path('mwr'), 'summary_mwr_%Y%m%d.nc')
 dld = {
     'cl61':DL_cl61,
     'mrr':DL_mrr,
@@ -40,7 +40,7 @@ def get_met_tab(augment=False):
 if __name__ == '__main__':
     from panel import serve
     dld = {
-        'asfs': DataLoader.DataLoader('asfs','/data/asfs', 'summary_asfs_slow_%Y%m%d.nc')
+        'asfs': DataLoader.DataLoader('asfs',DataLoader.data_path('asfs'), 'summary_asfs_slow_%Y%m%d.nc')
     }
     tab = get_met_tab()
     tab.dld = dld
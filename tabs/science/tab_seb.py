@@ -14,8 +14,8 @@ warnings.filterwarnings("once")
 
 from sleigh_dashboard import DataLoader, Plottables, Tab
 
-DL_asfs = DataLoader.DataLoader('lidar', '/data/cl61', 'summary_cl61_%Y%m%d.nc')
-DL_turb = DataLoader.DataLoader('mrr','/data/mrr', 'summary_mrr_%Y%m%d.nc')
+DL_asfs = DataLoader.DataLoader('lidar', DataLoader.data_path('cl61'), 'summary_cl61_%Y%m%d.nc')
+DL_turb = DataLoader.DataLoader('mrr',DataLoader.data_path('mrr'), 'summary_mrr_%Y%m%d.nc')
 dld = {
     'asfs':DL_asfs,
     'turb':DL_turb
@@ -38,38 +38,34 @@ class augplot1d(Plottables.Plot_line_scatter):
 
 def get_seb_tab(augment=False):
     pargs_asfs = {'x':'time', 'xlabel':'time', 'ylabel':'Power (W/m2)'}
-    
-    def pproc_rad(dd):
-        dd['asfs']['SW'] = dd['asfs']['sr30_swd_IrrC_mean'] - dd['asfs']['sr30_swu_IrrC_mean']
-        dd['asfs']['LW'] = dd['asfs']['ir20_lwd_Wm2_mean'] - dd['asfs']['ir20_lwu_Wm2_mean']
-        dd['asfs']['RAD'] = dd['asfs']['SW'] + dd['asfs']['LW']
-        return dd
+
+    # net fluxes, calculated once per datetime range and shared by every plot that shows them
+    derived = [
+        Tab.DerivedVariable('asfs', 'SW', lambda ds: ds['sr30_swd_IrrC_mean'] - ds['sr30_swu_IrrC_mean']),
+        Tab.DerivedVariable('asfs', 'LW', lambda ds: ds['ir20_lwd_Wm2_mean'] - ds['ir20_lwu_Wm2_mean']),
+        Tab.DerivedVariable('asfs', 'RAD', lambda ds: ds['SW'] + ds['LW'], requires=['SW', 'LW']),
+        Tab.DerivedVariable('turb', 'TURB', lambda ds: ds['Hs_mean'] + ds['Hl_mean']),
+    ]
 
     p_sw = \
         augplot1d('asfs', 'sr30_swu_IrrC_mean', {**pargs_asfs, 'label':'SWU'},'SW RADIATION', augment=augment) * \
         augplot1d('asfs', 'sr30_swd_IrrC_mean', {'label':'SWD'},'SW RADIATION', augment=augment) * \
-        augplot1d('asfs', 'SW', {'label':'SW total'},'SW RADIATION', posptroc=pproc_rad, augment=augment)
+        augplot1d('asfs', 'SW', {'label':'SW total'},'SW RADIATION', augment=augment)
 
-    def pproc_LW_total(dd):
-        dd['asfs']['LW'] = dd['asfs']['ir20_lwd_Wm2_mean'] - dd['asfs']['ir20_lwu_Wm2_mean']
-        return dd
     p_lw = \
         augplot1d('asfs', 'ir20_lwu_Wm2_mean', {**pargs_asfs, 'label':'LWU'}, 'LW RADIATION', augment=augment) * \
         augplot1d('asfs', 'ir20_lwd_Wm2_mean', {'label':'LWD'}, 'LW RADIATION', augment=augment) * \
-        augplot1d('asfs', 'LW', {'label':'LW total'}, 'LW RADIATION', posptroc=pproc_rad, augment=augment)
+        augplot1d('asfs', 'LW', {'label':'LW total'}, 'LW RADIATION', augment=augment)
 
     p_rad = \
-        augplot1d('asfs', 'SW', {**pargs_asfs, 'label':'SW'}, 'NET RADIATION', posptroc=pproc_rad, augment=augment) *\
-        augplot1d('asfs', 'LW', {**pargs_asfs, 'label':'LW'}, 'NET RADIATION', posptroc=pproc_rad, augment=augment) *\
-        augplot1d('asfs', 'RAD', {**pargs_asfs, 'label':'NET'}, 'NET RADIATION', posptroc=pproc_rad, augment=augment)
+        augplot1d('asfs', 'SW', {**pargs_asfs, 'label':'SW'}, 'NET RADIATION', augment=augment) *\
+        augplot1d('asfs', 'LW', {**pargs_asfs, 'label':'LW'}, 'NET RADIATION', augment=augment) *\
+        augplot1d('asfs', 'RAD', {**pargs_asfs, 'label':'NET'}, 'NET RADIATION', augment=augment)
 
-    def pproc_turbulent(dd):
-        dd['asfs']['TURB'] = dd['turb']['Hs_mean'] + dd['turb']['Hl_mean']
-        return dd
     p_turb = \
         augplot1d('turb', 'Hs_mean', {**pargs_asfs, 'label':'Sensible'}, 'TURBULENT HEAT', augment=augment) *\
         augplot1d('turb', 'Hl_mean', {'label':'Latent'}, 'TURBULENT HEAT FLUXES', augment=augment) *\
-        augplot1d('asfs', 'TURB', {'label': 'Net'}, 'TURBULENT HEAT FLUXES', posptroc=pproc_turbulent,augment=augment)
+        augplot1d('turb', 'TURB', {'label': 'Net'}, 'TURBULENT HEAT FLUXES', augment=augment)
     
     p_subsurf = \
         augplot1d('asfs', 'fp_A_Wm2_mean', {**pargs_asfs, 'label':'A'}, 'SUBSURFACE FLUX', augment=augment) *\
@@ -82,7 +78,8 @@ def get_seb_tab(augment=False):
         dld=None,
         required_DL=['asfs','turb'],
         longname='Surface Energy Budget',
-        augment_dims=augment
+        augment_dims=augment,
+        derived=derived
     )
     return seb_tab
 